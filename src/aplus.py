@@ -0,0 +1,90 @@
+# aplus.py
+from types import SimpleNamespace
+from datetime import datetime
+from urllib import parse
+
+from bs4 import BeautifulSoup, SoupStrainer, FeatureNotFound
+
+# lxml is optional, and much faster than html.parser on the calendar page
+HTML_PARSERS = ['lxml', 'html.parser']
+
+# only these parts of the calendar page are ever read, so only these are parsed
+CALENDAR_CLASSES = {'dayPanel', 'stv_tt_title'}
+CALENDAR_PARTS = SoupStrainer(class_=lambda c: c is not None and not CALENDAR_CLASSES.isdisjoint(c.split()))
+CONTENT_PART = SoupStrainer(id='content')
+
+def soup(html, only=None):
+    # the first parser bs4 can actually use (FeatureNotFound if not installed)
+    for parser in HTML_PARSERS[:-1]:
+        try:
+            return BeautifulSoup(html, parser, parse_only=only)
+        except FeatureNotFound:
+            HTML_PARSERS.remove(parser) # not looked for again
+    return BeautifulSoup(html, HTML_PARSERS[-1], parse_only=only)
+
+def same_page(rel_link, pageurl):
+    # aPlus links are query strings meant for the page they appear on
+    urlparts = parse.urlsplit(pageurl)
+    return parse.urlunsplit(
+        parse.urlsplit(rel_link)._replace(
+            scheme=urlparts.scheme,
+            netloc=urlparts.netloc,
+            path=urlparts.path
+            )
+    )
+
+class CalendarPage(object):
+    """
+    the parts of an aPlus attendance calendar used by the app: its events
+    and the link to the attendance summary
+    """
+    def __init__(self, html, url):
+        self.url = url
+        self.doc = soup(html, CALENDAR_PARTS)
+
+    def summary_url(self):
+        link = self.doc.select_one('.stv_tt_title a')
+        if link is None:
+            return None
+        return parse.urljoin(self.url, link.attrs['href'])
+
+    def events(self):
+        events = []
+        for d in self.doc.select('.dayPanel'):
+            date = datetime.strptime(d.attrs['id'], 'dayPanel_%d_%b_%y')
+            datestr = date.isoformat()
+            frag = date.strftime('%d_%b_%y').lstrip('0')
+            url = parse.urlunsplit(parse.urlsplit(self.url)._replace(fragment=frag))
+
+            for li in d.select('li'):
+                text = li.text.strip()
+                icon = li.find('i')
+                classes = icon.attrs.get('class', []) if icon is not None else []
+
+                if 'fa-check' in classes:
+                    (status, submit_link) = ('recorded', None)
+                elif 'fa-question' in classes:
+                    link = li.find('a')
+                    if link is not None:
+                        (status, submit_link) = ('open', same_page(link.attrs['href'], self.url))
+                    else:
+                        (status, submit_link) = ('missed', None)
+                else:
+                    print('Unrecognized aPlus html item classes: {}'.format(classes))
+                    continue
+
+                events.append(SimpleNamespace(text=text, due_at=datestr, status=status, url=url, link=submit_link))
+
+        return events
+
+def summary_html(html):
+    return str(soup(html, CONTENT_PART).find(id='content'))
+
+def attendance_form(html, pageurl):
+    # (destination, data) of the attendance form, or None if there is none
+    doc = soup(html, SoupStrainer('form', id='ctl00'))
+    form = doc.find('form', id='ctl00')
+    if form is None:
+        return None
+    data = {i.attrs['name']: i.attrs.get('value', '') for i in form.find_all('input') if 'name' in i.attrs}
+    return (same_page(form.attrs['action'], pageurl), data)
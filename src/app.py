@@ -2,37 +2,68 @@ import sys
 from time import time
 import webbrowser
 import base64
+import json
 import subprocess
 
 from json.decoder import JSONDecodeError
 
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
-from urllib import parse
 
-from PyQt5.Qt import *
+from PyQt5.QtCore import *
 from PyQt5.QtGui import *
+from PyQt5.QtWidgets import *
 
 from canvasapi import Canvas
-from canvasapi.exceptions import Unauthorized
+from canvasapi.exceptions import Unauthorized, InvalidAccessToken
+from requests.exceptions import ConnectionError
 
-from guihelper import disp_html
-from login import auth_canvas_session, auth_echo_session
+from guihelper import disp_html, confirm_dialog
 from classdefs import (
     CanvasItem, CourseItem, CONTENT_TYPES,
     CustomProxyModel, CustomStyledItemDelegate, CustomComboBox, CustomPushButton,
-    SliderHLayout, CheckableComboBox
+    SliderHLayout, CheckableComboBox, SearchBox
 )
 
 from utils import Preferences
 
 from locations import ResourceFile
+from pagination import paginated, PREFETCH_WORKERS
+from network import CLIENT
+from scheduler import SCHEDULER
+from snapshot import Snapshot, obj_to_dict
+from poller import ChangePoller
+from searchindex import SEARCH
+from sync import item_key
+from downloads import DownloadPlan, MirrorJob, Manifest
+from conversion import ConversionQueue
+from appcontrol import CONVERTIBLE_EXTENSIONS
+from websession import WebLogins
+from asyncengine import ENGINE
+from rowbridge import BRIDGE
+from startuptrace import TRACE
+from usercache import USERS
+
+# what a changed preference invalidates (see apply_preferences); keys not
+# listed here are read where they are used, so changing them needs nothing
+PREFERENCE_EFFECTS = {
+    'baseurl': 'reconnect', # new api client, user, terms and course list
+    'token': 'reconnect',
+    'engine': 'engine', # reconfigure the network engine
+    'defaultcontent': 'refilter' # show that content type
+}
 
 class CanvasApp(QMainWindow):
     SIZE = (800, 600)
     TITLE = 'Canvas Browser'
 
+    COURSE_WORKERS = 8 # course nickname lookups in flight at once
+
     def __init__(self, *args, **kwargs):
+        splash = kwargs.pop('splash', None) # closed once the window is up
+
         super(QMainWindow, self).__init__(*args, **kwargs)
 
         # establish easy reference to running QApplication
@@ -49,31 +80,118 @@ class CanvasApp(QMainWindow):
             # this means no preferences (user closed pref window)
             sys.exit()
 
+        TRACE.mark('preferences loaded')
+
+        self.snapshot = Snapshot(self.preferences.current['baseurl'], self.preferences.current['token'])
+
+        self.conversions = ConversionQueue(parent=self)
+        self.mirrored = {} # path queued for conversion -> root of the mirror it is in
+
         self.init_api()
+        self.logins = None # started once online (see startup_network)
 
-        # use credentials to do logins
-        # self.authenticate_session()
-        threading.Thread(target=self.authenticate_session).start()
+        # until the first requests are answered, show what the last session knew
+        self.user = None
+        self.OFFLINE = True
+        self.terms = self.snapshot.terms
 
         self.build()
 
         if self.preferences.message_present():
             self.print(self.preferences.get_message(), 0)
 
-        #populate courses after loading
-        # self.add_courses()
-        threading.Thread(target=self.add_courses).start()
+        # start from last snapshot, then bring it up to date (see load_course_list)
+        self.restored = bool(self.snapshot.load())
+        self.complete = False # course list loaded from canvas (see save_snapshot)
+        SEARCH.clear() # indexed again as rows are added (possibly another account than last time)
+        if self.restored:
+            self.snapshot.restore(self)
 
         self.connect_signals()
 
+        self.poller = None
+        self.resyncing = set() # ids of course items being resynced (see refresh_changed_courses)
+
         # self.tree.sortByColumn(1, Qt.DescendingOrder) # most recent at top
 
         self.show()
         
         self.center_on_screen()
 
-        self.print('Welcome, {}!'.format(self.user.get_profile()['name']),  append=True)
+        if splash is not None:
+            splash.finish(self)
+        TRACE.mark('window shown')
+
+        # network work only starts once the window is up
+        threading.Thread(target=self.startup_network, daemon=True).start()
+
+    def startup_network(self):
+        # worker thread: results are applied on the gui thread (see online_ready)
+        try:
+            (user, courses) = self.go_online()
+            self.start_logins()
+        except ConnectionError:
+            (user, courses) = (None, None)
+        except InvalidAccessToken:
+            # revoked, or mistyped in the settings file: ask for a new one (see token_rejected)
+            USERS.forget(self.canvas)
+            (user, courses) = (None, None)
+            BRIDGE.post(self.token_rejected)
+        except Exception as e:
+            # e.g. a base url that is not a canvas server: stay offline, and say why
+            (user, courses) = (None, None)
+            BRIDGE.post(self.print, 'Could not go online ({}).'.format(e))
+        TRACE.mark('user and courses fetched')
+        BRIDGE.post(self.online_ready, user, courses)
+
+    def online_ready(self, user, courses):
+        self.user = user
+        self.OFFLINE = courses is None
+        if self.OFFLINE:
+            # no network: fall back on whatever the snapshot knows
+            self.terms = self.snapshot.terms
+            self.print('Offline: showing courses as of last session.', append=True)
+            TRACE.report()
+            return
+
+        self.terms = self.unique_terms(courses)
+        self.synchronize_terms_to_gui()
+        self.start_poller()
+        self.print('Welcome, {}!'.format(self.user.name),  append=True)
+        threading.Thread(target=self.load_course_list, args=(courses,), daemon=True).start()
+
+    def token_rejected(self):
+        self.print('Canvas rejected the access token: enter a new one in Preferences.')
+        # the dialog is modal, so it is opened outside the BRIDGE batch
+        QTimer.singleShot(0, self.ask_for_token)
+
+    def ask_for_token(self):
+        oldprefs = self.preferences.current
+        self.preferences.populate_fields({k: v for (k, v) in oldprefs.items() if k != 'token'})
+        if self.preferences.run() and self.preferences.current != oldprefs:
+            self.print('Application preferences changed.')
+            self.apply_preferences(oldprefs)
 
+    def load_course_list(self, courses):
+        # worker thread: course items are built here, rows inserted by BRIDGE
+        if self.restored:
+            self.reconcile_courses(courses)
+        else:
+            self.add_courses(courses)
+        TRACE.mark('course list loaded')
+        BRIDGE.post(self.course_list_loaded)
+
+        if self.restored:
+            # what was expanded last session may have changed since: resync it
+            BRIDGE.flush() # removed courses are gone first
+            items = [self.modelroot.child(r, 0) for r in range(self.modelroot.rowCount())]
+            items = [item for item in items if item.rowCount() > 0]
+            self.resyncing.update(id(item) for item in items)
+            self.resync_courses(items)
+
+    def course_list_loaded(self):
+        self.complete = True
+        TRACE.report()
 
     def auth_get(self, url):
         return self.canvas._Canvas__requester.request('GET', _url=url)
@@ -81,45 +199,32 @@ class CanvasApp(QMainWindow):
 # -------------------- INITIALIZATION METHODS --------------------
 
     def init_api(self):
-        self.canvas = Canvas(
+        # no requests are made here (see go_online)
+        # enough keep-alive connections for every scheduler slot and page prefetch at once
+        CLIENT.set_pool_size(self.preferences.current['baseurl'], SCHEDULER.max_limit + PREFETCH_WORKERS)
+        self.canvas = CLIENT.attach(Canvas(
             self.preferences.current['baseurl'],
             self.preferences.current['token']
+        ))
+        SCHEDULER.install(self.canvas._Canvas__requester)
+        ENGINE.configure(self.preferences.current.get('engine', 'threads'), self.canvas._Canvas__requester)
+
+    def start_logins(self):
+        # worker thread: web logins (in the background; see WebLogins) for the current account,
+        # whose cookies go to the session of the current canvas client
+        self.preferences.get_web_credentials(self.preferences.current)
+        self.logins = WebLogins(
+            self.preferences.web_credentials,
+            self.preferences.current['baseurl'],
+            self.canvas._Canvas__requester._session
         )
-        self.user = self.canvas.get_current_user()
-        self.terms = self.unique_terms()
-
-    def authenticate_session(self):
-        if self.preferences.web_credentials['canvas'] is not None:
-            auth_canvas_session(
-                self.preferences.web_credentials['canvas'],
-                self.preferences.current['baseurl'],
-                self.canvas._Canvas__requester._session
-            )
-            testurl = parse.urlunsplit(parse.urlsplit(self.preferences.current['baseurl'])._replace(path=''))
-            try:
-                r = self.auth_get(testurl)
-                if r.ok:
-                    self.CANVAS_AUTHENTICATED = True
-                else:
-                    self.CANVAS_AUTHENTICATED = False
-            except:
-                self.CANVAS_AUTHENTICATED = False
-        else:
-            self.CANVAS_AUTHENTICATED = False
+        self.logins.start()
 
-
-        if self.preferences.web_credentials['echo360'] is not None:
-            auth_echo_session(
-                self.preferences.web_credentials['echo360'],
-                self.canvas._Canvas__requester._session
-            )
-            try: # url returns json only if authenticated
-                self.auth_get('https://echo360.org/user/enrollments').json()
-                self.ECHO_AUTHENTICATED = True
-            except:
-                self.ECHO_AUTHENTICATED = False
-        else:
-            self.ECHO_AUTHENTICATED = False
+    def go_online(self):
+        # (user, course list), fetched without touching the gui (raises ConnectionError)
+        user = USERS.user(self.canvas)
+        courses = list(paginated(self.canvas.get_courses, include=['term', 'favorites']))
+        return (user, courses)
 
     def build(self):
 
@@ -186,9 +291,22 @@ class CanvasApp(QMainWindow):
         self.filterLayout.setStretch(0, 1)
         self.filterLayout.setStretch(1, 1)
 
+        self.nameFilterEdit = QLineEdit()
+        self.nameFilterEdit.setPlaceholderText('Filter by name')
+        self.nameFilterEdit.setClearButtonEnabled(True)
+
+        self.searchBox = SearchBox(index=SEARCH)
+
+        self.searchLayout = QHBoxLayout()
+        self.searchLayout.addWidget(self.nameFilterEdit)
+        self.searchLayout.addWidget(self.searchBox)
+        self.searchLayout.setStretch(0, 1)
+        self.searchLayout.setStretch(1, 1)
+
         # this is the layout that holds course filters and course treeview
         self.courseLayout = QVBoxLayout()
         self.courseLayout.addLayout(self.filterLayout)
+        self.courseLayout.addLayout(self.searchLayout)
 
         self.tree = QTreeView()
         self.model = QStandardItemModel(0, 2, self)
@@ -232,7 +350,9 @@ class CanvasApp(QMainWindow):
         self.file = self.bar.addMenu('Actions')
         self.file.addAction('Preferences', self.edit_preferences)
         self.file.addAction('Open Downloads', self.open_downloads, QKeySequence('Ctrl+O'))
+        self.file.addAction('Run Download Plan...', self.run_plan_file)
         self.file.addAction('Show User Profile', self.show_user, QKeySequence('Ctrl+U'))
+        self.file.addAction('Show Network Status', self.show_network_status)
 
         self.help = self.bar.addMenu('Help')
         self.help.addAction('{} Help'.format(self.TITLE), self.show_readme, QKeySequence('Ctrl+Shift+H'))
@@ -250,6 +370,8 @@ class CanvasApp(QMainWindow):
 
     def connect_signals(self):
         self.tree.doubleClicked.connect(self.tree_double_click)
+        self.tree.collapsed.connect(self.tree_collapsed)
+        self.conversions.converted.connect(self.conversion_done)
 
         self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
         self.tree.customContextMenuRequested.connect(self.tree_right_click)
@@ -260,12 +382,21 @@ class CanvasApp(QMainWindow):
         self.contentTypeComboBox.currentIndexChanged.connect(self.proxyModel.contentTypeChanged)
         self.favoriteSlider.valueChanged.connect(self.proxyModel.only_favorites_changed)
         self.termComboBox.selectionsChanged.connect(self.proxyModel.terms_changed)
+        self.searchBox.resultChosen.connect(self.reveal)
+        self.nameFilterEdit.textChanged.connect(self.proxyModel.name_filter_changed)
 
     def tree_double_click(self, proxyindex):
         # sourceindex = self.proxyModel.mapToSource(proxyindex)
         for item in self.selected_canvasitems():
+            item.clear_new()
             item.dblClickFcn(contentTypeIndex=self.contentTypeComboBox.currentIndex())
 
+    def tree_collapsed(self, proxyindex):
+        # stop fetching for an item nobody is looking at any more
+        item = self.model.itemFromIndex(self.proxyModel.mapToSource(proxyindex))
+        if item is not None:
+            ENGINE.cancel(item)
+
     def tree_right_click(self, point):
         selected = [item for item in self.selected_canvasitems() if item.isEnabled()]
         if len(selected) > 1:
@@ -316,8 +447,8 @@ class CanvasApp(QMainWindow):
         else:
             self.statusBar().showMessage(text, timeout)
 
-    def unique_terms(self):
-        all_terms = [c.term for c in self.canvas.get_courses(include='term')]
+    def unique_terms(self, courses):
+        all_terms = [c.term for c in courses]
         unique_terms = []
         for t in all_terms:
             if t not in unique_terms:
@@ -344,25 +475,142 @@ class CanvasApp(QMainWindow):
         self.proxyModel.terms = self.terms
         self.termComboBox.selectionChangedFcn(None)
 
-    def add_courses(self):
-        courses = list(self.canvas.get_courses(include=['term', 'favorites']))
-        numcourses = len(courses)
-        nicknames = [self.canvas.get_course_nickname(course.id) for course in courses]
+    def add_courses(self, courses=None):
+        # usually on a worker thread: items are built here, rows inserted by BRIDGE
+        if courses is None:
+            courses = list(paginated(self.canvas.get_courses, include=['term', 'favorites']))
+        with ThreadPoolExecutor(max_workers=self.COURSE_WORKERS) as pool:
+            nicknames = list(pool.map(lambda course: self.canvas.get_course_nickname(course.id), courses))
         classtypes = [d['subclass'] for d in CONTENT_TYPES]
 
         for classtype in classtypes:
-            for (i, course, nickname) in zip(range(numcourses), courses, nicknames):
-                fcn = lambda: self.make_and_add_courseitem(course, nickname, classtype)
-                fcn()
-                # threading.Thread(target=fcn).start()
+            for (course, nickname) in zip(courses, nicknames):
+                self.make_and_add_courseitem(course, nickname, classtype)
 
     def make_and_add_courseitem(self, course, nickname, classtype):
         item = classtype(object=course, gui=self, nickname=nickname)
-        self.modelroot.appendRow([item, item.date])
-
-    def reset_courses(self):
-        self.model.removeRows(0, self.model.rowCount())
-        self.add_courses()
+        BRIDGE.call(self.modelroot.appendRow, [item, item.date])
+
+    def find_item(self, path):
+        # walk the model along a list of item keys (see SearchIndex.item_path)
+        parent = self.modelroot
+        item = None
+        for key in path:
+            matches = [parent.child(r, 0) for r in range(parent.rowCount()) if item_key(parent.child(r, 0)) == key]
+            if len(matches) == 0:
+                return None
+            item = parent = matches[0]
+        return item
+
+    def reveal(self, path):
+        item = self.find_item(path)
+        if item is None:
+            SEARCH.remove_path(json.dumps(path))
+            self.print('That item is no longer loaded.')
+            return
+
+        # adjust filters so the item's course is shown
+        course = item.course()
+        if self.contentTypeComboBox.currentIndex() != course.CONTENT_TYPE_INDEX:
+            self.contentTypeComboBox.setCurrentIndex(course.CONTENT_TYPE_INDEX)
+        if self.favoriteSlider.value() and not course.obj.is_favorite:
+            self.favoriteSlider.setValue(False)
+
+        proxyindex = self.proxyModel.mapFromSource(item.index())
+        if proxyindex.isValid():
+            self.tree.scrollTo(proxyindex) # also expands collapsed parents
+            self.tree.setCurrentIndex(proxyindex)
+        else:
+            self.print('{} is hidden by the semester filter.'.format(item.text()))
+
+    def reconcile_courses(self, courses=None):
+        # update courses restored from a snapshot, touching only what changed
+        if courses is None:
+            courses = list(paginated(self.canvas.get_courses, include=['term', 'favorites']))
+        current = {c.id: c for c in courses}
+
+        # rows are read here but changed on the gui thread (removals stay in descending order)
+        for r in reversed(range(self.modelroot.rowCount())):
+            item = self.modelroot.child(r, 0)
+            course = current.get(item.obj.id)
+            if course is None:
+                BRIDGE.call(self.modelroot.removeRow, r)
+            elif obj_to_dict(course) != obj_to_dict(item.obj):
+                BRIDGE.call(self.update_courseitem, item, course)
+
+        known = set(self.modelroot.child(r, 0).obj.id for r in range(self.modelroot.rowCount()))
+        new = [course for course in courses if course.id not in known]
+        with ThreadPoolExecutor(max_workers=self.COURSE_WORKERS) as pool:
+            nicknames = list(pool.map(lambda course: self.canvas.get_course_nickname(course.id), new))
+        for (course, nickname) in zip(new, nicknames):
+            for d in CONTENT_TYPES:
+                self.make_and_add_courseitem(course, nickname, d['subclass'])
+
+        BRIDGE.call(self.proxyModel.invalidateFilter)
+
+    def update_courseitem(self, item, course):
+        item.obj = course
+        item.process_name()
+        item.init_from_obj()
+
+    def start_poller(self):
+        if self.poller is not None:
+            self.poller.stop()
+            self.poller = None
+        if not self.OFFLINE:
+            self.poller = ChangePoller(self.canvas, self.expanded_course_ids, self)
+            self.poller.coursesChanged.connect(self.refresh_changed_courses)
+            self.poller.start()
+
+    def expanded_course_ids(self):
+        items = [self.modelroot.child(r, 0) for r in range(self.modelroot.rowCount())]
+        return set(item.obj.id for item in items if item.rowCount() > 0)
+
+    def refresh_changed_courses(self, course_ids):
+        # resync only the expanded course items the poller flagged, on a worker thread
+        items = []
+        for r in range(self.modelroot.rowCount()):
+            item = self.modelroot.child(r, 0)
+            if item.obj.id in course_ids and item.rowCount() > 0 and id(item) not in self.resyncing:
+                items.append(item)
+        if items:
+            self.resyncing.update(id(item) for item in items)
+            threading.Thread(target=self.resync_courses, args=(items,), daemon=True).start()
+
+    def resync_courses(self, items):
+        newcount = 0
+        for item in items:
+            newcount += self.resync_tree(item)
+        BRIDGE.post(self.resync_done, items, newcount)
+
+    def resync_tree(self, item):
+        # worker thread: sync item, then every expanded container below it (see SyncEngine.sync)
+        try:
+            newcount = len(item.reexpand())
+        except Exception as e:
+            item.print('{0} not refreshed ({1}).'.format(item.name, e))
+            return 0
+        BRIDGE.flush() # rows it removed are gone
+        for ch in item.children():
+            if ch.rowCount() > 0:
+                newcount += self.resync_tree(ch)
+        return newcount
+
+    def resync_done(self, items, newcount):
+        self.resyncing.difference_update(id(item) for item in items)
+        if newcount > 0:
+            self.print('{} new item(s) found.'.format(newcount))
+            self.proxyModel.invalidateFilter()
+
+    def save_snapshot(self):
+        # a course list still loading (or never loaded: offline) would replace a
+        # complete snapshot with a partial one, so the last one is kept
+        if not self.complete:
+            return
+        try:
+            self.snapshot.save(self)
+        except OSError as e:
+            print('Snapshot not saved: {}'.format(e))
 
     def expand_all(self):
 
@@ -376,14 +624,19 @@ class CanvasApp(QMainWindow):
         for item in to_expand:
             item.expand_recursive()
 
+        self.save_snapshot()
+
     def generate_profile_html(self):
-        data = self.user.get_profile()
+        if self.OFFLINE:
+            return '<div align="center"><h3>Offline (no user profile available)</h3></div>'
+
+        data = USERS.profile(self.canvas)
 
         html = '<div align="center">'
         if 'name' in data:
             html += '<h1>{}</h1>'.format(data['name'])     
         if 'avatar_url' in data:
-            img_content = self.auth_get(data['avatar_url']).content
+            img_content = USERS.avatar(data['avatar_url'], self.auth_get)
             img_data_uri = base64.b64encode(img_content).decode('utf-8')
             html += '<br><img src="data:image/png;base64,{}">'.format(img_data_uri)
         if 'primary_email' in data:
@@ -393,7 +646,7 @@ class CanvasApp(QMainWindow):
         if 'bio' in data:
             html += '<p>{}</p>'.format(data['bio'])
 
-        auths = [self.CANVAS_AUTHENTICATED, self.ECHO_AUTHENTICATED]
+        auths = [self.logins.authenticated(name, timeout=0) for name in self.preferences.web_credentials]
 
         if any(auths):
             html += '<h3>Web Credentials (from Keychain)</h3>'
@@ -409,12 +662,46 @@ class CanvasApp(QMainWindow):
 
         return html
 
+    def generate_network_html(self):
+        conns = CLIENT.stats()
+        sched = SCHEDULER.state()
+
+        html = '<div align="center">'
+        html += '<h3>Connections</h3>'
+        html += '<p>'
+        html += 'Requests sent: {}<br/>'.format(conns['requests'])
+        html += 'Connections created: {}<br/>'.format(conns['created'])
+        html += 'Connections reused: {}<br/>'.format(conns['reused'])
+        html += '</p>'
+        html += '<h3>Request Scheduler</h3>'
+        html += '<p>'
+        html += 'Concurrency limit: {}<br/>'.format(sched['limit'])
+        html += 'Active / queued: {0} / {1}<br/>'.format(sched['active'], sched['queued'])
+        html += 'Rate limit remaining: {}<br/>'.format(sched['remaining'] if sched['remaining'] is not None else 'unknown')
+        html += 'Completed: {}<br/>'.format(sched['completed'])
+        html += 'Throttled: {0} ({1} retries)<br/>'.format(sched['throttled'], sched['retries'])
+        html += '</p>'
+        bridge = BRIDGE.stats()
+        html += '<h3>Background Row Updates</h3>'
+        html += '<p>'
+        html += 'Applied: {0} in {1} batch(es), {2} queued<br/>'.format(bridge['applied'], bridge['batches'], bridge['queued'])
+        html += 'Longest wait: {:.0f} ms<br/>'.format(1000 * bridge['max_wait'])
+        html += 'Timer lag (mean / max): {0:.1f} / {1:.1f} ms<br/>'.format(1000 * bridge['mean_lag'], 1000 * bridge['max_lag'])
+        html += '</p>'
+        html += '</div>'
+
+        return html
+
 # -------------------- MENU ACTION METHODS --------------------
 
     def show_user(self):
         htmlstr = self.generate_profile_html()
         disp_html(htmlstr, title='Current User', parent=self)
 
+    def show_network_status(self):
+        htmlstr = self.generate_network_html()
+        disp_html(htmlstr, title='Network Status', parent=self, width=400, height=400)
+
     def show_readme(self):
         with open(ResourceFile('docs/README.html'),'r') as file:
             htmlstr = file.read()
@@ -427,12 +714,91 @@ class CanvasApp(QMainWindow):
 
         if accepted and self.preferences.current != oldprefs:
             self.print('Application preferences changed.')
-            self.init_api() # reset canvasapi instance
-            self.synchronize_terms_to_gui() # account for potentially new set of course terms
-            self.reset_courses() # trigger repopulation of classes
+            self.apply_preferences(oldprefs)
+
+    def apply_preferences(self, oldprefs):
+        # redo only what the changed keys affect (see PREFERENCE_EFFECTS)
+        newprefs = self.preferences.current
+        changed = [k for k in set(oldprefs) | set(newprefs) if oldprefs.get(k) != newprefs.get(k)]
+        effects = set(PREFERENCE_EFFECTS[k] for k in changed if k in PREFERENCE_EFFECTS)
+
+        if 'reconnect' in effects:
+            if self.poller is not None:
+                self.poller.stop()
+                self.poller = None
+            self.save_snapshot()
+            self.snapshot = Snapshot(newprefs['baseurl'], newprefs['token'])
+            self.init_api() # reset canvasapi instance (also configures the engine)
+            self.model.removeRows(0, self.model.rowCount())
+            SEARCH.clear() # results of the previous account must not show up
+            self.restored = False
+            self.complete = False
+            # user, terms and courses are fetched in the background, and the web logins
+            # redone for the new client's session (see startup_network)
+            threading.Thread(target=self.startup_network, daemon=True).start()
+        elif 'engine' in effects:
+            ENGINE.configure(newprefs.get('engine', 'threads'), self.canvas._Canvas__requester)
+
+        if 'refilter' in effects:
+            self.contentTypeComboBox.setCurrentIndex(newprefs['defaultcontent'])
+
+    def closeEvent(self, event):
+        if self.poller is not None:
+            self.poller.stop()
+        self.save_snapshot()
+        SEARCH.commit()
+        self.conversions.close()
+        ENGINE.close()
+        super().closeEvent(event)
 
     def open_downloads(self):
         folder = self.preferences.current['downloadfolder']
         subprocess.check_call(['open', folder])
 
+    def run_plan(self, plan, name):
+        self.print('Downloading {0} file(s) from {1} ...'.format(len(plan), name))
+        job = MirrorJob(plan, self.canvas._Canvas__requester, self)
+        job.message.connect(self.print)
+        job.finished.connect(lambda counts: self.plan_finished(job, name, counts))
+        job.start()
+
+    def plan_finished(self, job, name, counts):
+        self.print('{0}: {downloaded} downloaded, {linked} linked, {unchanged} unchanged, {failed} failed.'.format(name, **counts))
+        convertible = [p for p in job.written if p.suffix in CONVERTIBLE_EXTENSIONS]
+        if convertible and self.conversions.available():
+            if confirm_dialog('Convert {} downloaded Office file(s) to PDF?'.format(len(convertible)),
+                title='Convert Files', yesno=True, parent=self
+            ):
+                # the mirror's manifest learns about each pdf (see conversion_done)
+                for p in convertible:
+                    self.mirrored[str(p)] = job.plan.root
+                self.conversions.submit(convertible)
+
+    def conversion_done(self, path, error, seconds):
+        root = self.mirrored.pop(path, None)
+        if error:
+            self.print('Conversion of {0} failed ({1}).'.format(Path(path).name, error))
+            return
+        self.print('{0} converted to a PDF ({1:.1f} s).'.format(Path(path).name, seconds))
+        if root is not None:
+            # so that re-running the mirror does not restore the original
+            manifest = Manifest.for_root(root)
+            manifest.record_conversion(Path(path).relative_to(root))
+            manifest.save()
+
+    def run_plan_file(self):
+        (filename, _) = QFileDialog.getOpenFileName(self, 'Run Download Plan',
+            self.preferences.current['downloadfolder'], 'Download Plans (*.json)'
+        )
+        if filename:
+            try:
+                plan = DownloadPlan.load(filename)
+            except (OSError, ValueError, KeyError) as e:
+                self.print('Could not read download plan ({}).'.format(e))
+                return
+            if confirm_dialog('Run download plan into {0}?\n{1}'.format(plan.root, plan.describe()),
+                title='Confirm Download', parent=self
+            ):
+                self.run_plan(plan, Path(filename).name)
+
 
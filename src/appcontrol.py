@@ -1,9 +1,27 @@
-from subprocess import Popen, PIPE, run
+from subprocess import Popen, PIPE, STDOUT, DEVNULL
 from pathlib import Path
 import os
+import re
+import sys
+import shutil
+import signal
+import socket
+import threading
+import importlib.util
+from time import time, sleep
 
 CONVERTIBLE_EXTENSIONS = ['.doc', '.docx', '.ppt', '.pptx', '.xls', '.xlsx']
 
+def kill_tree(p):
+    # soffice is a wrapper around soffice.bin: kill the whole group (see start_new_session)
+    if os.name == 'posix':
+        try:
+            os.killpg(p.pid, signal.SIGKILL)
+        except OSError:
+            pass
+    else:
+        p.kill()
+
 def run_osascript(script, args=[]):
     p = Popen(['osascript', '-'] + args, stdin=PIPE, stdout=PIPE, stderr=PIPE, universal_newlines=True)
     stdout, stderr = p.communicate(script)
@@ -49,6 +67,9 @@ tell application "Microsoft Excel"
 end tell
 """
 
+def as_hfs(path):
+    return ('Macintosh HD' + str(path)).replace(os.path.sep, ':')
+
 def convert(*args):
     infile = Path(args[0])
     if infile.suffix in ['.doc', '.docx']:
@@ -71,11 +92,282 @@ def convert(*args):
     # if outfile.exists():
         # print('Overwriting existing PDF file. {} may require access.'.format(app))
 
-    infile_asform = ('Macintosh HD' + str(infile)).replace(os.path.sep, ':')
-    outfile_asform = ('Macintosh HD' + str(outfile)).replace(os.path.sep, ':')
+    infile_asform = as_hfs(infile)
+    outfile_asform = as_hfs(outfile)
 
     formatted = script.format(infile_asform, outfile_asform)
     ret = run_osascript(formatted)
 
+# ---------------------------- CONVERSION BACKENDS ----------------------------
+# each backend converts a batch of files to pdfs next to them, calling
+# report(path, error, seconds) as each file finishes (error is None if
+# the pdf was written)
+
+OFFICE_APPS = {
+    '.doc': 'Word', '.docx': 'Word',
+    '.ppt': 'PowerPoint', '.pptx': 'PowerPoint',
+    '.xls': 'Excel', '.xlsx': 'Excel'
+}
+
+def written_since(path, start):
+    pdf = Path(path).with_suffix('.pdf')
+    return pdf.exists() and pdf.stat().st_mtime >= start - 1
+
+def as_applescript_list(strings):
+    quoted = ['"{}"'.format(s.replace('\\', '\\\\').replace('"', '\\"')) for s in strings]
+    return '{' + ', '.join(quoted) + '}'
+
+# per-document steps, run inside "tell application" with inPath / outPath set
+batchsteps = {
+    'Word': """
+            open file inPath
+            tell active document
+                save as it file name outPath file format format PDF
+                close saving no
+            end tell""",
+    'PowerPoint': """
+            open file inPath
+            tell active presentation
+                save in outPath as save as PDF
+                close saving no
+            end tell""",
+    'Excel': """
+            open file inPath
+            tell page setup object of active sheet
+                set page orientation to landscape
+                set zoom to false
+                set fit to pages wide to 1
+                set fit to pages tall to 9999
+            end tell
+            save as active sheet filename outPath file format PDF file format
+            close active workbook saving no"""
+}
+
+# one application session for the whole batch; a marker is logged
+# (to stderr) after every document so progress can be timed as it happens
+batchscript = """
+set inputs to {inputs}
+set outputs to {outputs}
+tell application "Microsoft {app}"
+    launch
+    repeat with i from 1 to count of inputs
+        set inPath to item i of inputs
+        set outPath to item i of outputs
+        try{steps}
+            tell me to log "done " & i
+        on error errMsg
+            tell me to log "fail " & i & " " & errMsg
+        end try
+    end repeat
+    quit
+end tell
+"""
+
+class OfficeConverter(object):
+    """
+    drives Microsoft Office via osascript (macOS only), launching each
+    application once per batch rather than once per file
+    """
+    BATCH_SIZE = 40
+
+    @staticmethod
+    def available():
+        return sys.platform == 'darwin'
+
+    def convert_batch(self, paths, report):
+        apps = {}
+        for p in paths:
+            apps.setdefault(OFFICE_APPS[Path(p).suffix.lower()], []).append(p)
+        for (app, group) in apps.items():
+            self.run_session(app, group, report)
+
+    def run_session(self, app, paths, report):
+        script = batchscript.format(
+            app=app,
+            steps=batchsteps[app],
+            inputs=as_applescript_list([as_hfs(p) for p in paths]),
+            outputs=as_applescript_list([as_hfs(Path(p).with_suffix('.pdf')) for p in paths])
+        )
+        p = Popen(['osascript', '-'], stdin=PIPE, stdout=DEVNULL, stderr=PIPE, universal_newlines=True)
+        p.stdin.write(script)
+        p.stdin.close()
+
+        reported = set()
+        last = time()
+        for line in p.stderr:
+            parts = line.strip().split(' ', 2)
+            if len(parts) >= 2 and parts[0] in ('done', 'fail') and parts[1].isdigit():
+                now = time()
+                path = paths[int(parts[1]) - 1]
+                error = None if parts[0] == 'done' else (parts[2] if len(parts) > 2 else 'failed')
+                report(path, error, now - last)
+                reported.add(path)
+                last = now
+        p.wait()
+
+        for path in paths: # the session died before reaching these
+            if path not in reported:
+                report(path, '{} quit unexpectedly'.format(app), 0.0)
+
+class LibreOfficeListener(object):
+    """
+    long-lived headless libreoffice driven over uno (needs the "uno"
+    module shipped with libreoffice); saves a process launch per batch
+    """
+    BATCH_SIZE = 20
+    FILTERS = {
+        '.doc': 'writer_pdf_Export', '.docx': 'writer_pdf_Export',
+        '.ppt': 'impress_pdf_Export', '.pptx': 'impress_pdf_Export',
+        '.xls': 'calc_pdf_Export', '.xlsx': 'calc_pdf_Export'
+    }
+
+    def __init__(self):
+        self.process = None
+        self.desktop = None
+
+    @staticmethod
+    def available():
+        # uno ships with libreoffice (not on pypi); only imported once a batch is converted
+        return importlib.util.find_spec('uno') is not None and LibreOfficeConverter.available()
+
+    @staticmethod
+    def free_port():
+        # a port nothing else is listening on (another libreoffice may hold the usual 2002)
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+
+    def connect(self):
+        import uno
+
+        if self.desktop is not None and self.process.poll() is None:
+            return
+        port = self.free_port()
+        self.process = Popen([
+            LibreOfficeConverter.executable(), '--headless', '--norestore', '--nologo',
+            '--accept=socket,host=127.0.0.1,port={};urp;'.format(port)
+        ], stdout=DEVNULL, stderr=DEVNULL)
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext('com.sun.star.bridge.UnoUrlResolver', local)
+        url = 'uno:socket,host=127.0.0.1,port={};urp;StarOffice.ComponentContext'.format(port)
+        for attempt in range(50): # listener takes a few seconds to come up
+            if self.process.poll() is not None:
+                raise RuntimeError('LibreOffice listener quit on start')
+            try:
+                ctx = resolver.resolve(url)
+                break
+            except Exception:
+                sleep(0.2)
+        else:
+            self.process.kill()
+            raise RuntimeError('LibreOffice listener did not start')
+        self.desktop = ctx.ServiceManager.createInstanceWithContext('com.sun.star.frame.Desktop', ctx)
+
+    @staticmethod
+    def prop(name, value):
+        import uno
+        p = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+        p.Name = name
+        p.Value = value
+        return p
+
+    def convert_batch(self, paths, report):
+        try:
+            self.connect()
+        except Exception as e:
+            for p in paths:
+                report(p, str(e), 0.0)
+            return
+
+        import uno
+
+        for p in paths:
+            start = time()
+            try:
+                doc = self.desktop.loadComponentFromURL(uno.systemPathToFileUrl(str(Path(p).resolve())),
+                    '_blank', 0, (self.prop('Hidden', True),))
+                try:
+                    doc.storeToURL(uno.systemPathToFileUrl(str(Path(p).resolve().with_suffix('.pdf'))),
+                        (self.prop('FilterName', self.FILTERS[Path(p).suffix.lower()]),))
+                finally:
+                    doc.close(True)
+                report(p, None, time() - start)
+            except Exception as e:
+                report(p, str(e), time() - start)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                self.process.terminate()
+            self.process = None
+            self.desktop = None
+
+class LibreOfficeConverter(object):
+    """
+    headless libreoffice; one process launch converts a whole batch
+    """
+    BATCH_SIZE = 20
+    TIMEOUT = 600 # seconds per batch
+    doneRE = re.compile(r'^convert (.+) -> ')
+
+    @staticmethod
+    def executable():
+        return shutil.which('soffice') or shutil.which('libreoffice')
+
+    @classmethod
+    def available(cls):
+        return cls.executable() is not None
+
+    def convert_batch(self, paths, report):
+        # --outdir applies to the whole command, so group by folder
+        folders = {}
+        for p in paths:
+            folders.setdefault(Path(p).parent, []).append(p)
+
+        for (folder, group) in folders.items():
+            cmd = [self.executable(), '--headless', '--convert-to', 'pdf', '--outdir', str(folder)]
+            start = last = time()
+            reported = set()
+            output = []
+            try:
+                p = Popen(cmd + [str(f) for f in group], stdout=PIPE, stderr=STDOUT, universal_newlines=True,
+                    start_new_session=(os.name == 'posix'))
+                # reading stdout blocks until soffice exits, so a hung one is killed by a watchdog
+                expired = threading.Event()
+                watchdog = threading.Timer(self.TIMEOUT, lambda: (expired.set(), kill_tree(p)))
+                watchdog.start()
+                for line in p.stdout: # "convert <input> -> <output> using filter ..." as each file completes
+                    output.append(line.strip())
+                    m = self.doneRE.match(line)
+                    if m:
+                        now = time()
+                        done = [f for f in group if str(f) == m.group(1) or Path(f).resolve() == Path(m.group(1)).resolve()]
+                        for f in done:
+                            report(f, None if written_since(f, start) else 'no pdf written', now - last)
+                            reported.add(f)
+                        last = now
+                p.wait()
+                watchdog.cancel()
+                if expired.is_set():
+                    error = 'timed out after {} s'.format(self.TIMEOUT)
+                else:
+                    error = output[-1] if output else 'no pdf written'
+            except Exception as e:
+                error = str(e)
+            for f in group:
+                if f not in reported:
+                    report(f, None if written_since(f, start) else error, time() - last)
+
+CONVERTERS = [OfficeConverter, LibreOfficeListener, LibreOfficeConverter] # in order of preference
+
+def default_converter():
+    for cls in CONVERTERS:
+        if cls.available():
+            return cls()
+    return None
+
 if __name__ == '__main__':
     pass
@@ -0,0 +1,155 @@
+# asyncengine.py
+import asyncio
+import threading
+import importlib.util
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from scheduler import SCHEDULER
+
+ENGINES = [
+    {'tag': 'threads', 'displayname': 'Threads (one request at a time per item)'},
+    {'tag': 'asyncio', 'displayname': 'Asyncio (concurrent metadata requests)'}
+]
+
+MAX_CONCURRENT = 32 # requests started at once (the scheduler's limit still applies)
+TIMEOUT = 30 # seconds per request
+
+class AsyncEngine(object):
+    """
+    optional asyncio http client for canvas api metadata requests
+
+    an event loop on one background thread multiplexes many requests;
+    items submit requests under their own name (owner), so collapsing an
+    item cancels whatever it still has in flight, and closing the window
+    cancels everything; every request takes a slot of the request
+    scheduler, like canvasapi requests do, and is retried when throttled
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.loop = None
+        self.client = None
+        self.semaphore = None
+        self.requester = None
+        self.gate = ThreadPoolExecutor(max_workers=MAX_CONCURRENT, thread_name_prefix='asyncgate')
+        self.pending = {} # id(owner) -> (owner, set of futures); items are not hashable
+
+    @staticmethod
+    def available():
+        # httpx is optional, and only imported once the engine is used
+        return importlib.util.find_spec('httpx') is not None
+
+    def configure(self, tag, requester):
+        with self.lock:
+            self.enabled = tag == 'asyncio' and self.available()
+            self.requester = requester
+            # the client holds the old token and base url: the next request makes a new one
+            (client, self.client) = (self.client, None)
+            loop = self.loop
+        if client is not None:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    def start_locked(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name='asyncengine', daemon=True).start()
+
+    async def get_json(self, path, params=None):
+        # GET an api path (relative to .../api/v1/), watched by the request scheduler
+        if self.client is None:
+            import httpx
+            self.client = httpx.AsyncClient(
+                base_url=self.requester.base_url,
+                headers={'Authorization': 'Bearer {}'.format(self.requester.access_token)},
+                limits=httpx.Limits(max_connections=MAX_CONCURRENT),
+                timeout=TIMEOUT
+            )
+            self.semaphore = asyncio.Semaphore(MAX_CONCURRENT)
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                await self.acquire()
+                try:
+                    r = await self.client.get(path, params=params)
+                finally:
+                    SCHEDULER.release()
+            SCHEDULER.observe(r)
+            if r.status_code in (403, 429) and 'Rate Limit Exceeded' in r.text and attempt < SCHEDULER.max_retries:
+                SCHEDULER.on_throttle()
+                attempt += 1
+                await asyncio.sleep(SCHEDULER.retry_delay(attempt))
+                continue
+            r.raise_for_status()
+            SCHEDULER.on_success()
+            return r.json()
+
+    async def acquire(self):
+        # SCHEDULER.acquire blocks, so it waits on a thread of its own (not the
+        # loop's executor, which httpx needs); a slot granted after the request
+        # was cancelled is handed back
+        future = asyncio.get_running_loop().run_in_executor(self.gate, SCHEDULER.acquire)
+        try:
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(lambda f: SCHEDULER.release() if not f.cancelled() and f.exception() is None else None)
+            raise
+
+    def submit(self, coro, owner=None):
+        # schedule a coroutine on the engine's loop; returns a concurrent.futures.Future
+        with self.lock:
+            self.start_locked()
+            future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+            self.pending.setdefault(id(owner), (owner, set()))[1].add(future)
+        future.add_done_callback(lambda f: self.forget(owner, f))
+        return future
+
+    def forget(self, owner, future):
+        with self.lock:
+            entry = self.pending.get(id(owner))
+            if entry is not None:
+                entry[1].discard(future)
+                if not entry[1]:
+                    del self.pending[id(owner)]
+
+    def get_many(self, paths, owner=None):
+        # {path: json, or the exception it raised}; CancelledError if owner is cancelled
+        futures = {p: self.submit(self.get_json(p), owner) for p in paths}
+        results = {}
+        for (p, f) in futures.items():
+            try:
+                results[p] = f.result()
+            except CancelledError:
+                for other in futures.values():
+                    other.cancel()
+                raise
+            except Exception as e:
+                results[p] = e
+        return results
+
+    def cancel(self, owner):
+        # cancel what owner, or any item below it, still has in flight
+        with self.lock:
+            futures = [
+                f for (o, fs) in self.pending.values()
+                if o is owner or any(p is owner for p in getattr(o, 'lineage', lambda: [])())
+                for f in fs
+            ]
+        for f in futures:
+            f.cancel()
+        return len(futures)
+
+    def close(self):
+        with self.lock:
+            futures = [f for (o, fs) in self.pending.values() for f in fs]
+            loop = self.loop
+        for f in futures:
+            f.cancel()
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), loop)
+
+    async def shutdown(self):
+        if self.client is not None:
+            await self.client.aclose()
+        asyncio.get_running_loop().stop()
+
+ENGINE = AsyncEngine()
@@ -1,31 +1,43 @@
 import sys
 from time import time
 import json
-import math
-from types import SimpleNamespace
+from functools import partial
 import os
-import re
 from pathlib import Path
 import webbrowser
 import pytz
 from dateutil.parser import isoparse
 from datetime import datetime
-import requests
 import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, CancelledError
 
-from PyQt5.Qt import *
+from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 
-from bs4 import BeautifulSoup
 from urllib import parse
 
 from canvasapi import Canvas
 from canvasapi.favorite import Favorite
-from canvasapi.exceptions import Unauthorized, ResourceDoesNotExist
-from appcontrol import convert, CONVERTIBLE_EXTENSIONS
+from canvasapi.file import File
+from canvasapi.page import Page
+from canvasapi.discussion_topic import DiscussionTopic
+from canvasapi.quiz import Quiz
+from canvasapi.assignment import Assignment
+from canvasapi.exceptions import CanvasException, Unauthorized, ResourceDoesNotExist
+from appcontrol import CONVERTIBLE_EXTENSIONS
 from guihelper import disp_html, confirm_dialog, DownloadDialog, alert
 from locations import ResourceFile
+from pagination import paginated
+from network import CLIENT
+from gqlbackend import GraphQLBackend, GraphQLError
+from sync import SYNC, stamp
+from echocache import ECHO360_CACHE
+from echorecord import LectureRecord, loads, DOWNLOAD_PROFILES
+from asyncengine import ENGINE
+from rowbridge import BRIDGE, on_gui_thread
+from searchindex import SEARCH
+from downloads import DownloadPlan, FileStore, safe_name, si_ify_size
 
 class CustomItem(QStandardItem):
     """
@@ -33,13 +45,19 @@ class CustomItem(QStandardItem):
     (not intended to be instantiated directly)
     """
     # 
+    ORDERED_LISTING = False # True if children are listed newest-first (see SyncEngine)
 
     def __init__(self, *args, **kwargs):
+        datestr = kwargs.pop('datestr', None) # known date (e.g. from snapshot) avoids lookup
         super().__init__(*args, **kwargs)
 
+        self.collecting = None # list while gathering children for a sync
+        self.sync_mode = None
+        self.listing_marks = {} # newest ordering key per listing, during a sync
+
         self.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
 
-        self.date = DateItem(item=self)
+        self.date = DateItem(item=self, datestr=datestr)
 
         self.CONTEXT_MENU_ACTIONS = []
         self.update_context_menu()
@@ -48,6 +66,9 @@ class CustomItem(QStandardItem):
         pass
 
     def expand(self, **kwargs):
+        self.mark_expanded()
+
+    def mark_expanded(self):
         if 'Refresh' not in [a['displayname'] for a in self.CONTEXT_MENU_ACTIONS]:
             self.CONTEXT_MENU_ACTIONS.extend([
                 {'displayname': 'Refresh', 'function': self.reexpand, 'multiitem': True}
@@ -55,12 +76,120 @@ class CustomItem(QStandardItem):
             self.update_context_menu()
 
     def reexpand(self, **kwargs):
-        self.removeRows(0, self.rowCount())
-        self.expand(**kwargs)
+        inserted = SYNC.sync(self, **kwargs)
+        for item in inserted:
+            BRIDGE.call(item.mark_new)
+        return inserted
+
+    def set_bold(self, bold):
+        font = self.font()
+        font.setBold(bold)
+        self.setFont(font)
+
+    def mark_new(self):
+        # shown bold until the user opens it
+        self.is_new = True
+        self.set_bold(True)
+
+    def clear_new(self):
+        self.is_new = False
+        self.set_bold(self.needs_attention())
+
+    def needs_attention(self):
+        return getattr(self, 'is_new', False)
+
+    def collect_children(self, **kwargs):
+        # run expand, but gather the would-be children instead of adding them
+        self.collecting = []
+        try:
+            self.expand(**kwargs)
+        finally:
+            collected, self.collecting = self.collecting, None
+        return collected
+
+    def update_from(self, other):
+        # take over the content of a fresher copy of this item (keeps row and children)
+        self.obj = other.obj
+        self.date.set_datetime(other.date.datetime)
+        self.refresh_display()
+        SEARCH.add(self)
+
+    def refresh_display(self):
+        pass
+
+    def search_text(self):
+        # text (possibly html) indexed for search besides the item name
+        return ''
 
     def download(self, **kwargs):
         pass
 
+    def plan_download(self, plan, relpath):
+        # add whatever this item would download (below relpath) to plan
+        pass
+
+    def plan_children(self, plan, relpath):
+        # containers download into a folder of their own name
+        folder = relpath / safe_name(self.name)
+        plan.add_folder(folder)
+        self.expand_for_plan()
+        for ch in self.children():
+            ch.plan_download(plan, folder)
+
+    def expand_for_plan(self):
+        # items already expanded are planned from the rows they show (no requests)
+        if self.rowCount() == 0 and self.isEnabled():
+            self.expand(wait=True)
+            BRIDGE.flush() # rows from this worker thread are in the tree once applied
+
+    def make_plan(self, **kwargs):
+        plan = DownloadPlan(kwargs.get('location', self.course().downloadfolder))
+        self.plan_download(plan, Path())
+        return plan
+
+    def plan_in_background(self, make, then):
+        # planning may list folders not expanded yet: off the gui thread, then
+        # then(plan) (which may open a dialog) on it, outside the BRIDGE batch
+        def work():
+            try:
+                plan = make()
+            except Exception as e:
+                self.print('Download not planned ({}).'.format(e))
+                return
+            BRIDGE.post(QTimer.singleShot, 0, lambda: then(plan))
+        self.print('Planning download of {} ...'.format(self.name))
+        threading.Thread(target=work, daemon=True).start()
+
+    def download_tree(self, **kwargs):
+        self.plan_in_background(lambda: self.make_plan(**kwargs), lambda plan: self.confirm_plan(plan, **kwargs))
+
+    def confirm_plan(self, plan, **kwargs):
+        confirm = kwargs.get('confirm', True)
+
+        if confirm:
+            confirmed = confirm_dialog('Download contents of {0}?\n{1}'.format(self.name, plan.describe()),
+                title='Confirm Download',
+                parent=self.course().gui
+            )
+        else:
+            confirmed = True
+
+        if confirmed:
+            self.course().gui.run_plan(plan, self.name)
+
+    def export_plan(self, **kwargs):
+        gui = self.course().gui
+        (filename, _) = QFileDialog.getSaveFileName(gui, 'Export Download Plan',
+            str(Path(self.course().downloadfolder) / '{}.plan.json'.format(safe_name(self.name))),
+            'Download Plans (*.json)'
+        )
+        if filename:
+            self.plan_in_background(lambda: self.make_plan(**kwargs), lambda plan: self.plan_export(plan, filename))
+
+    def plan_export(self, plan, filename):
+        plan.export(filename)
+        self.print('Plan exported: {}'.format(plan.describe().replace('\n', ' ')))
+
     def itemChangeFcn(self):
         pass
 
@@ -80,6 +209,18 @@ class CustomItem(QStandardItem):
         return [self.child(r, 0) for r in range(self.rowCount())]
 
     def append_item_row(self, item):
+        if self.collecting is not None:
+            if not item in self.collecting:
+                self.collecting.append(item)
+            return
+
+        # a model is only ever changed on the gui thread
+        if self.model() is not None and not on_gui_thread():
+            BRIDGE.post(self.insert_item_row, item)
+        else:
+            self.insert_item_row(item)
+
+    def insert_item_row(self, item):
         children = self.children()
         lineage = self.lineage()
 
@@ -88,24 +229,43 @@ class CustomItem(QStandardItem):
             row.append(item)
             row.append(item.date)
             self.appendRow(row)
+            SEARCH.add(item)
+
+    def remove_item_row(self, row):
+        if self.model() is not None and not on_gui_thread():
+            BRIDGE.post(self.remove_item_row, row)
+            return
+        SEARCH.remove(self.child(row, 0))
+        self.removeRow(row)
 
     def toolitem_from_obj(self, obj):
-        if obj.label == 'Echo360' and self.gui.ECHO_AUTHENTICATED:
-            return Echo360Item(object=obj)
-        elif obj.label == 'aPlus+ Attendance' and self.gui.CANVAS_AUTHENTICATED:
-            return APlusAttendanceItem(object=obj)
-        else:
-            return TabItem(object=obj)
+        # None while the tab's web login is still in progress on the gui thread:
+        # the row is then added once the login is done (see add_toolitem)
+        login = WEB_TOOL_LOGINS.get(obj.label)
+        if login is not None and on_gui_thread() and not self.gui.logins.done(login):
+            self.gui.logins.when_done(login, lambda: BRIDGE.post(self.add_toolitem, obj))
+            return None
+        # off the gui thread, wait for the login if it is still in progress
+        if login is not None and self.gui.logins.authenticated(login):
+            return WEB_TOOL_ITEMS[obj.label](object=obj)
+        return TabItem(object=obj)
+
+    def add_toolitem(self, obj):
+        self.insert_item_row(self.toolitem_from_obj(obj))
 
     def update_context_menu(self):
-        self.contextMenu = QMenu()
-        for d in self.CONTEXT_MENU_ACTIONS:
-            action = self.contextMenu.addAction(d['displayname'])
-            action.triggered.connect(d['function'])
+        # items may be built on worker threads, so the menu (a widget) is
+        # only built on the gui thread, when first shown (see run_context_menu)
+        self.contextMenu = None
 
     def run_context_menu(self, point):
         if self.isEnabled():
-            if len(self.contextMenu.actions()) > 0:
+            if len(self.CONTEXT_MENU_ACTIONS) > 0:
+                if self.contextMenu is None:
+                    self.contextMenu = QMenu()
+                    for d in self.CONTEXT_MENU_ACTIONS:
+                        action = self.contextMenu.addAction(d['displayname'])
+                        action.triggered.connect(d['function'])
                 action = self.contextMenu.exec_(point)
             
     def course(self):
@@ -116,7 +276,8 @@ class CustomItem(QStandardItem):
             return self.parent().course()
 
     def print(self, text):
-        self.course().gui.print(text)
+        # the status bar is only touched on the gui thread
+        BRIDGE.call(self.course().gui.print, text)
 
     def open_and_notify(self, url):
         self.print('Opening linked url:\n{}'.format(url))
@@ -158,6 +319,9 @@ class CanvasItem(CustomItem):
     def api_get(self, urlpath):
         return self.obj._requester.request('GET', urlpath)
 
+    def refresh_display(self):
+        self.process_name()
+
     def process_name(self):
         if hasattr(self.obj, 'name'):
             self.name = self.obj.name
@@ -179,10 +343,27 @@ class CanvasItem(CustomItem):
         else:
             return self.obj.id
 
+    def since_last_sync(self, objs, listing, key=stamp):
+        # during an incremental sync, cut a listing ordered newest-first by key
+        # at the first object that has not changed since the last sync
+        mark = SYNC.watermark(self, listing) if self.sync_mode == 'incremental' else None
+        newest = None
+        try:
+            for obj in objs:
+                s = key(obj)
+                if mark is not None and s is not None and s <= mark:
+                    return
+                if s is not None and (newest is None or s > newest):
+                    newest = s
+                yield obj
+        finally:
+            if self.sync_mode is not None and newest is not None:
+                self.listing_marks[listing] = newest
+
     def safe_get_folders(self, folder=None):
         parent = folder if folder else self.obj
         try:
-            folders = list(parent.get_folders())
+            folders = list(paginated(parent.get_folders))
         except Unauthorized:
             self.print('Unauthorized!')
             folders = []
@@ -191,7 +372,8 @@ class CanvasItem(CustomItem):
     def safe_get_files(self, folder=None):
         parent = folder if folder else self.obj
         try:
-            files = list(parent.get_files())
+            # newest first, so an incremental sync can stop early
+            files = list(self.since_last_sync(paginated(parent.get_files, sort='updated_at', order='desc'), 'files'))
         except Unauthorized:
             self.print('Unauthorized!')
             files = []
@@ -201,6 +383,8 @@ class CanvasItem(CustomItem):
         parts = parse.urlsplit(url)
 
     def get_html_links(self, html):
+        from bs4 import BeautifulSoup # slow to import, so not at startup
+
         linkdict = {}
         soup = BeautifulSoup(html, 'html.parser')
         links = soup.find_all('a')
@@ -318,6 +502,7 @@ class CourseItem(CanvasItem):
     """
     class for tree elements with corresponding canvasapi "course" objects
     """
+    MIRRORABLE = False # True if the whole course can be downloaded (see plan_download)
 
     def __init__(self, *args, **kwargs):
 
@@ -325,7 +510,6 @@ class CourseItem(CanvasItem):
         self.nickname = kwargs.pop('nickname', None)
 
         self.content = self.gui.contentTypeComboBox.currentIndex()
-        self.downloadfolder = self.gui.preferences.current['downloadfolder']
 
         super().__init__(*args, **kwargs)
 
@@ -333,6 +517,16 @@ class CourseItem(CanvasItem):
 
         self.init_from_obj()
 
+    # read from the preferences when used, so changing them needs no reload
+
+    @property
+    def downloadfolder(self):
+        return self.gui.preferences.current['downloadfolder']
+
+    @property
+    def backend(self):
+        return self.gui.preferences.current['backend']
+
     def refresh(self):
         self.refresh_course_obj()
         self.process_name()
@@ -361,9 +555,18 @@ class CourseItem(CanvasItem):
             {'displayname': 'Edit Nickname', 'function': self.edit_text, 'multiitem': False}
         ])
 
+        if self.MIRRORABLE:
+            self.CONTEXT_MENU_ACTIONS.extend([
+                {'displayname': 'Mirror Course', 'function': self.download_tree, 'multiitem': True},
+                {'displayname': 'Export Download Plan', 'function': self.export_plan, 'multiitem': False}
+            ])
+
         self.update_context_menu()
 
     def add_favorite(self):
+        if self.gui.user is None: # offline, or not connected yet
+            self.print('Favorites can only be changed once connected to Canvas.')
+            return
         self.favoriteobj = self.gui.user.add_favorite_course(self.obj.id)
         self.refresh()
 
@@ -419,20 +622,34 @@ class CourseModulesItem(CourseItem):
     CourseItem which expands modules
     """
     CONTENT_TYPE_INDEX = 0
+    MIRRORABLE = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.setIcon(QIcon(ResourceFile('icons/book_module.png')))
 
+    def plan_download(self, plan, relpath):
+        self.plan_children(plan, relpath)
+
     def get_modules(self):
+        modules = None
+        if self.backend == 'graphql':
+            try:
+                modules = GraphQLBackend(self.gui.canvas, self.obj).get_modules()
+            except GraphQLError as e:
+                self.print('GraphQL query failed ({}); falling back to REST.'.format(e))
+
+        if modules is None:
+            modules = ((m, None) for m in paginated(self.obj.get_modules))
+
         ct = 0
-        for m in self.obj.get_modules():
-            item = ModuleItem(object=m)
+        for (m, items) in modules:
+            item = ModuleItem(object=m, items=items)
             self.append_item_row(item)
             ct += 1
         if ct == 0:
-            self.setEnabled(False) # if module is empty
+            BRIDGE.call(self.setEnabled, False) # if module is empty
 
     def expand(self, **kwargs):
         # threading.Thread(target=self.get_modules).start()
@@ -444,14 +661,19 @@ class CourseFilesItem(CourseItem):
     CourseItem which expands filesystem
     """
     CONTENT_TYPE_INDEX = 1
+    ORDERED_LISTING = True
+    MIRRORABLE = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.setIcon(QIcon(ResourceFile('icons/book_folder.png')))
 
+    def plan_download(self, plan, relpath):
+        self.plan_children(plan, relpath)
+
     def get_root_folder(self):
-        all_folders = self.obj.get_folders()
+        all_folders = paginated(self.obj.get_folders)
         first_levels = [f for f in all_folders if len(Path(f.full_name).parents) == 1]
         assert len(first_levels) == 1
         return first_levels[0]
@@ -471,7 +693,7 @@ class CourseFilesItem(CourseItem):
                 item = FolderItem(object=folder)
                 self.append_item_row(item)
         else:
-            self.setEnabled(False)
+            BRIDGE.call(self.setEnabled, False)
 
 
     def expand(self, **kwargs):
@@ -490,13 +712,13 @@ class CourseAssignmentsItem(CourseItem):
         self.setIcon(QIcon(ResourceFile('icons/book_assignment.png')))
 
     def get_assignments(self):
-        assignments = self.obj.get_assignments()
-        if len(list(assignments)) > 0:
-            for a in assignments:
-                item = AssignmentItem(object=a)
-                self.append_item_row(item)
-        else:
-            self.setEnabled(False)
+        ct = 0
+        for a in paginated(self.obj.get_assignments):
+            item = AssignmentItem(object=a)
+            self.append_item_row(item)
+            ct += 1
+        if ct == 0:
+            BRIDGE.call(self.setEnabled, False)
 
     def expand(self, **kwargs):
         self.get_assignments()
@@ -514,13 +736,14 @@ class CourseToolsItem(CourseItem):
         self.setIcon(QIcon(ResourceFile('icons/book_link.png')))
 
     def get_tools(self):
-        tabs = [t for t in self.obj.get_tabs() if t.type == 'external']
+        tabs = [t for t in paginated(self.obj.get_tabs) if t.type == 'external']
         if len(tabs) > 0:
             for t in tabs:
                 item = self.toolitem_from_obj(t)
-                self.append_item_row(item)
+                if item is not None:
+                    self.append_item_row(item)
         else:
-            self.setEnabled(False)
+            BRIDGE.call(self.setEnabled, False)
 
     def expand(self, **kwargs):
         self.get_tools()
@@ -531,6 +754,7 @@ class CourseAnnouncementsItem(CourseItem):
     CourseItem which expands announcements
     """
     CONTENT_TYPE_INDEX = 4
+    ORDERED_LISTING = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -538,13 +762,15 @@ class CourseAnnouncementsItem(CourseItem):
         self.setIcon(QIcon(ResourceFile('icons/book_announcement.png')))
 
     def get_announcements(self):
-        announcements = self.obj.get_discussion_topics(only_announcements=True)
-        if len(list(announcements)) > 0:
-            for a in announcements:
-                item = AnnouncementItem(object=a)
-                self.append_item_row(item)
-        else:
-            self.setEnabled(False)
+        ct = 0
+        # listed by recent activity, so cut on the same key (edits alone wait for a full sync)
+        topics = paginated(self.obj.get_discussion_topics, only_announcements=True, order_by='recent_activity')
+        for a in self.since_last_sync(topics, 'announcements', key=recent_activity):
+            item = AnnouncementItem(object=a)
+            self.append_item_row(item)
+            ct += 1
+        if ct == 0:
+            BRIDGE.call(self.setEnabled, False)
 
     def expand(self, **kwargs):
         self.get_announcements()
@@ -605,6 +831,7 @@ class TabItem(CanvasItem):
         r1 = self.auth_get(self.retrieve_sessionless_url())
         assert r1.ok
 
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(r1.text, 'html.parser')
         postform = soup.find(id='tool_form')
         data = {i.attrs['name']: i.attrs.get('value', '') for i in postform.find_all('input')}
@@ -616,14 +843,34 @@ class TabItem(CanvasItem):
 
 class Echo360Item(TabItem):
     """
-    docstring for Echo360Item
+    tab item for a course's echo360 section
+
+    the lti launch is only followed (two requests) when the item is first
+    opened or expanded; lecture media is fetched in parallel and cached
+    per section, and rows appear as their media arrives
     """
+    MAX_PARALLEL = 8 # media requests in flight at once
+
     def __init__(self, *args, **kwargs):
+        state = kwargs.pop('state', None) # resolved urls (e.g. from snapshot)
         super().__init__(*args, **kwargs)
 
         self.setIcon(QIcon(ResourceFile('icons/echo360.png')))
 
-        self.get_urls()
+        self.CONTEXT_MENU_ACTIONS.extend([
+            {'displayname': 'Archive All Lectures', 'function': self.archive, 'multiitem': True},
+            {'displayname': 'Export Download Plan', 'function': self.export_plan, 'multiitem': False}
+        ])
+        self.update_context_menu()
+
+        self.resolved = False
+        self.loading = False
+        if state is not None:
+            self.restore_urls(state)
+
+    def ensure_urls(self):
+        if not self.resolved:
+            self.get_urls()
 
     def get_urls(self):
         r = self.follow_sessionless_url()
@@ -639,6 +886,25 @@ class Echo360Item(TabItem):
             self.urlparts = parsed._replace(path=str(location.parent))
         else:
             self.ACTIVE = False
+        self.resolved = True
+
+    def saved_urls(self):
+        if not self.resolved:
+            return None
+        state = {'desturl': self.desturl, 'active': self.ACTIVE}
+        if self.ACTIVE:
+            state['section_id'] = self.section_id
+            state['urlparts'] = parse.urlunsplit(self.urlparts)
+        return state
+
+    def restore_urls(self, state):
+        self.resolved = True
+        self.desturl = state['desturl']
+        self.ACTIVE = state['active']
+        if self.ACTIVE:
+            self.homeurl = self.desturl
+            self.section_id = state['section_id']
+            self.urlparts = parse.urlsplit(state['urlparts'])
 
     def make_url(self, relpath):
         if self.ACTIVE:
@@ -661,55 +927,132 @@ class Echo360Item(TabItem):
         else:
             return None
 
-    def get_lecture_urls(self):
+    def get_lesson_ids(self):
         if self.ACTIVE:
-            syllabus = self.get_syllabus()
-            ids = [l['lesson']['lesson']['id'] for l in syllabus]
-            paths = ['/lesson/{}/media'.format(i) for i in ids]
-            return [parse.urlunsplit(self.urlparts._replace(path=p)) for p in paths]
+            return [l['lesson']['lesson']['id'] for l in self.get_syllabus()]
         else:
             return None
 
+    def lesson_url(self, lesson_id):
+        return parse.urlunsplit(self.urlparts._replace(path='/lesson/{}/media'.format(lesson_id)))
+
+    def get_lecture_urls(self):
+        ids = self.get_lesson_ids()
+        return [self.lesson_url(i) for i in ids] if ids is not None else None
+
+    def lesson_media(self, lesson_id):
+        # compact lecture record (as a dict, see LectureRecord.to_dict)
+        media = ECHO360_CACHE.get(self.section_id, lesson_id)
+        if media is None:
+            r = self.auth_get(self.lesson_url(lesson_id))
+            media = LectureRecord.from_media(loads(r.content)['data'][0]).to_dict()
+            if media['videos'] or media['audio']: # still processing otherwise: fetch again next time
+                ECHO360_CACHE.put(self.section_id, lesson_id, media)
+        return media
+
     def expand(self, **kwargs):
-        if self.ACTIVE:
-            urls = self.get_lecture_urls()
-            for u in urls:
-                r = self.auth_get(u)
-                js = r.json()['data'][0]
-                item = Echo360LectureItem(json=js)
-                self.append_item_row(item)
+        # rows stream in from a worker thread, unless the caller needs them now
+        if self.collecting is not None or kwargs.get('wait', False):
+            self.load_lectures(self.append_item_row)
+        elif not self.loading:
+            self.loading = True
+            # straight to the model, even if a sync starts collecting meanwhile
+            add = lambda item: BRIDGE.call(self.insert_item_row, item)
+            threading.Thread(target=self.load_in_background, args=(add,)).start()
 
-            if len(urls) == 0:
-                self.setEnabled(False)
-        else:
+        super().expand(**kwargs)
+
+    def load_in_background(self, add):
+        try:
+            self.load_lectures(add)
+        finally:
+            self.loading = False
+
+    def load_lectures(self, add):
+        self.ensure_urls()
+        ids = self.get_lesson_ids()
+        if ids is None:
             self.print('Course is not activated on Echo360.')
+            return
 
-        super().expand(**kwargs)
+        with ThreadPoolExecutor(max_workers=self.MAX_PARALLEL) as pool:
+            futures = [pool.submit(self.lesson_media, i) for i in ids]
+            for f in as_completed(futures):
+                try:
+                    add(Echo360LectureItem(json=f.result()))
+                except Exception as e:
+                    self.print('Echo360 lecture not loaded ({}).'.format(e))
+
+        ECHO360_CACHE.prune(self.section_id, ids)
+        ECHO360_CACHE.save()
+
+        if len(ids) == 0:
+            BRIDGE.call(self.setEnabled, False)
 
     def open(self, **kwargs):
+        self.ensure_urls()
         self.open_and_notify(self.desturl)
 
     def dblClickFcn(self, **kwargs):
         self.expand(**kwargs)
 
+    def plan_download(self, plan, relpath):
+        self.ensure_urls()
+        if self.ACTIVE:
+            self.plan_children(plan, relpath)
+
+    def plan_archive(self, plan, **kwargs):
+        # every lecture, named by date, in <course>/<tab>, with a lectures.json/.csv catalog
+        folder = Path(safe_name(self.course().name)) / safe_name(self.name)
+        plan.add_folder(folder)
+        self.expand_for_plan()
+
+        lectures = sorted(self.children(), key=lambda ch: (ch.obj.created_at or '', ch.name))
+        taken = set()
+        keys = [lecture.plan_archive(plan, folder, taken, **kwargs) for lecture in lectures]
+        plan.add_catalog(folder, 'lectures', keys)
+
+        rate = self.course().gui.preferences.current.get('echobandwidth', 0)
+        plan.max_rate = rate * 1e6 if rate else None
+
+    def archive(self, **kwargs):
+        self.plan_in_background(lambda: self.make_archive_plan(**kwargs), lambda plan: self.confirm_archive(plan, **kwargs))
+
+    def make_archive_plan(self, **kwargs):
+        self.ensure_urls()
+        if not self.ACTIVE:
+            raise ValueError('course is not activated on Echo360')
+
+        plan = DownloadPlan(kwargs.get('location', self.course().downloadfolder))
+        self.plan_archive(plan, **kwargs)
+        return plan
+
+    def confirm_archive(self, plan, **kwargs):
+        confirm = kwargs.get('confirm', True)
+
+        if confirm:
+            confirmed = confirm_dialog('Archive all lectures of {0}?\n{1}'.format(self.course().name, plan.describe()),
+                title='Confirm Download',
+                parent=self.course().gui
+            )
+        else:
+            confirmed = True
+
+        if confirmed:
+            self.course().gui.run_plan(plan, '{} lectures'.format(self.course().name))
+
 class Echo360LectureItem(CustomItem):
     """
     class for individual echo360 lectures
     notably NOT a CanvasItem (and has no canvas obj)
     """
-    durationRE = re.compile(r'PT([\d\.]+)S')
-
     def __init__(self, *args, **kwargs):
-        self.json = kwargs.pop('json', None)
-
-        self.obj = self.objectify(self.json)
-
-        # set up property to be used by date item
-        self.obj.created_at = self.obj.lesson.createdAt
+        # compact record (created_at is used by the date item)
+        self.obj = LectureRecord.load(kwargs.pop('json'))
 
         super().__init__(*args, **kwargs)
 
-        self.name = self.obj.lesson.name
+        self.name = self.obj.name
 
         self.calculate_duration()
 
@@ -721,25 +1064,27 @@ class Echo360LectureItem(CustomItem):
             {'displayname': 'Open', 'function': self.open, 'multiitem': True},
             {'displayname': 'Download', 'function': self.download, 'multiitem': True}
         ])
+        for p in DOWNLOAD_PROFILES: # same names on every lecture, so these work on a selection too
+            self.CONTEXT_MENU_ACTIONS.extend([
+                {'displayname': 'Download {}'.format(p['displayname']),
+                 'function': partial(self.download, profile=p['tag']),
+                 'multiitem': True}
+            ])
         self.update_context_menu()
 
         self.setIcon(QIcon(ResourceFile('icons/video.png')))
 
-        self.basepath = Path('/lesson/{}'.format(self.obj.lesson.id))
+        self.basepath = Path('/lesson/{}'.format(self.obj.lesson_id))
 
-    @staticmethod
-    def objectify(item):  
-        if isinstance(item, dict):
-            newitems = {k:Echo360LectureItem.objectify(v) for (k,v) in item.items()}
-            return SimpleNamespace(**newitems)
-        elif isinstance(item, (list, tuple)):
-            return [Echo360LectureItem.objectify(v) for v in item]
-        else:
-            return item
+    @property
+    def json(self):
+        return self.obj.to_dict()
+
+    def filename(self):
+        return self.obj.original.name or '{}.mp4'.format(safe_name(self.name))
 
     def calculate_duration(self):
-        m = self.durationRE.match(self.obj.video.media.media.current.duration)
-        self.duration_seconds = round(float(m.group(1)))
+        self.duration_seconds = self.obj.duration
         self.duration_dict = {
             'hours': self.duration_seconds // 3600,
             'minutes': (self.duration_seconds % 3600) // 60,
@@ -751,7 +1096,7 @@ class Echo360LectureItem(CustomItem):
         return parse.urlunsplit(newparts)
 
     def identifier(self):
-        return self.obj.lesson.id
+        return self.obj.lesson_id
 
     def show_info(self):
         htmlstr = self.generate_info_html()
@@ -764,14 +1109,26 @@ class Echo360LectureItem(CustomItem):
         openpath = self.basepath / 'classroom'
         self.open_and_notify(self.make_url(openpath))
 
-    def make_downloadurl(self, **kwargs):
-        hd = kwargs.get('hidef', True)
+    def rendition(self, **kwargs):
+        # profile from kwargs, else from preferences (see LectureRecord.rendition)
+        prefs = self.course().gui.preferences.current
+        profile = kwargs.get('profile', prefs.get('echoprofile', 'hd'))
+        return self.obj.rendition(profile, prefs.get('echoresolution', 720))
 
-        online_filename = 'hd1.mp4' if hd else 'sd1.mp4'
-        media_id = self.obj.video.media.id
-        downloadpath = Path('media/download/{0}/video/{1}'.format(media_id, online_filename))
+    def make_downloadurl(self, **kwargs):
+        (profile, kind, mediafile, online_filename) = self.rendition(**kwargs)
+        media_id = self.obj.media_id
+        downloadpath = Path('media/download/{0}/{1}/{2}'.format(media_id, kind, online_filename))
         return self.make_url(downloadpath)
 
+    def local_filename(self, **kwargs):
+        # hd video keeps the original upload's name; other profiles are tagged
+        (profile, kind, mediafile, online_filename) = self.rendition(**kwargs)
+        name = Path(self.filename())
+        if profile in ('hd', 'original'):
+            return name.name
+        return '{0} ({1}){2}'.format(name.stem, profile, Path(online_filename).suffix or name.suffix)
+
     def fetch_and_save_data(self, url, filepath): # STREAM DOWNLOAD
         req = self.parent().obj._requester
         r = req._session.get(url, stream=True) # session has echo360 authentication cookies
@@ -799,7 +1156,7 @@ class Echo360LectureItem(CustomItem):
             confirmed = True
 
         if confirmed:
-            filename = self.obj.video.media.media.originalFile.name
+            filename = self.local_filename(**kwargs)
             newpath = Path(loc) / filename # build local file Path obj
 
             if not newpath.exists():
@@ -808,16 +1165,54 @@ class Echo360LectureItem(CustomItem):
             else:
                 self.print('{0} already exists at {1}; file not replaced.'.format(filename, loc))
 
-    def si_ify_size(self, number):
-        prefixes = ['', 'k', 'M', 'G', 'T']
-        pow10 = math.floor(math.log10(number))
-        prefix = prefixes[pow10 // 3]
-        quantity = number / (10 ** pow10)
-        return '{0:.1f} {1}B'.format(quantity, prefix)
+    def plan_download(self, plan, relpath, **kwargs):
+        (profile, kind, mediafile, online_filename) = self.rendition(**kwargs)
+        # the kind keeps these manifest entries apart from archive ones (other paths, other date)
+        plan.add_url('echo360:download:{0}:{1}'.format(self.obj.media_id, profile), self.make_downloadurl(**kwargs),
+            relpath / self.local_filename(**kwargs),
+            size=mediafile.size or None,
+            updated_at=self.obj.updated_at or self.obj.created_at,
+            auth='echo360'
+        )
+
+    def archive_filename(self, taken, **kwargs):
+        # "<date> <name>", made unique among the names already taken
+        (profile, kind, mediafile, online_filename) = self.rendition(**kwargs)
+        suffix = Path(online_filename).suffix or '.mp4'
+        stem = safe_name('{0} {1}'.format((self.obj.created_at or '')[:10], self.name).strip())
+        filename = stem + suffix
+        n = 2
+        while filename in taken:
+            filename = '{0} ({1}){2}'.format(stem, n, suffix)
+            n += 1
+        return filename
+
+    def plan_archive(self, plan, folder, taken, **kwargs):
+        # keyed by media id alone (no updated_at), so a re-run skips anything archived before
+        (profile, kind, mediafile, online_filename) = self.rendition(**kwargs)
+        filename = self.archive_filename(taken, **kwargs)
+        key = 'echo360:archive:{0}:{1}'.format(self.obj.media_id, profile)
+        plan.add_url(key, self.make_downloadurl(**kwargs), folder / filename,
+            size=mediafile.size or None,
+            auth='echo360',
+            info={
+                'lesson_id': self.obj.lesson_id,
+                'media_id': self.obj.media_id,
+                'name': self.name,
+                'date': self.obj.created_at,
+                'duration': self.duration_seconds,
+                'duration_text': '{hours:d}:{minutes:02d}:{seconds:02d}'.format(**self.duration_dict),
+                'profile': profile,
+                'width': mediafile.width,
+                'height': mediafile.height
+            }
+        )
+        taken.add(filename)
+        return key
 
     def generate_info_html(self):
         html = '<div align="center">'
-        html += '<h2>{}</h2>'.format(self.obj.lesson.name)     
+        html += '<h2>{}</h2>'.format(self.obj.name)
         if self.duration_dict['hours'] > 0:
             html += '<h3>Duration: {hours} hrs, {minutes} min, {seconds} sec</h3>'.format(**self.duration_dict)
         elif self.duration_dict['minutes'] > 0:
@@ -827,19 +1222,16 @@ class Echo360LectureItem(CustomItem):
 
         html += '<p>Files:</p>'
         html += '<ul align="left">'
-        html += '<li>Original: {}</li>'.format(self.si_ify_size(self.obj.video.media.media.originalFile.sizeInBytes))
-        videofiles = self.obj.video.media.media.current.primaryFiles
-        videofiles.sort(reverse=True, key=lambda f: f.size)
-        html += '<li>High Definition ({0}x{1}): {2}</li>'.format(
-            videofiles[0].width, videofiles[0].height, self.si_ify_size(videofiles[0].size)
-        )
-        html += '<li>Standard Definition ({0}x{1}): {2}</li>'.format(
-            videofiles[1].width, videofiles[1].height, self.si_ify_size(videofiles[1].size)
-        )
-        audiofile = self.obj.video.media.media.current.audioFiles[0]
-        html += '<li>Audio Only: {}</li>'.format(
-            self.si_ify_size(audiofile.size)
-        )
+        if self.obj.original.name: # not every lecture has its upload
+            html += '<li>Original: {}</li>'.format(si_ify_size(self.obj.original.size))
+        for (label, videofile) in zip(['High Definition', 'Standard Definition'], self.obj.videos):
+            html += '<li>{0} ({1}x{2}): {3}</li>'.format(
+                label, videofile.width, videofile.height, si_ify_size(videofile.size)
+            )
+        for audiofile in self.obj.audio[:1]:
+            html += '<li>Audio Only: {}</li>'.format(
+                si_ify_size(audiofile.size)
+            )
         html += '</ul>'
 
         html += '</div>'
@@ -847,6 +1239,14 @@ class Echo360LectureItem(CustomItem):
         return html
 
 class APlusAttendanceItem(TabItem):
+    """
+    tab item for a course's aPlus attendance calendar
+
+    the lti launch (two requests) is done once and its session reused
+    until aPlus stops accepting it; the attendance summary is fetched
+    alongside the events, so it is usually ready when displayed
+    """
+    SESSION_TTL = 15 * 60 # seconds a launched session is trusted before relaunching
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -858,72 +1258,82 @@ class APlusAttendanceItem(TabItem):
         ])
         self.update_context_menu()
 
-        # self.get_events()
+        self.launch_lock = threading.Lock()
+        self.launched_at = 0
+        self.calendar_url = None
+        self.summary_url = None
+        self.landing = None # calendar page returned by the last launch, until used
+        self.summary = None # (html, time fetched)
+
+    def relaunch(self, since):
+        # full lti launch, unless another thread has already relaunched since `since`
+        from aplus import CalendarPage # bs4 is slow to import, so not at startup
+
+        with self.launch_lock:
+            if self.launched_at != since:
+                return
+            r = self.follow_sessionless_url()
+            page = CalendarPage(r.text, r.url)
+            self.calendar_url = r.url
+            self.summary_url = page.summary_url()
+            self.landing = page
+            self.launched_at = time()
+
+    def session_get(self, url):
+        # GET within the launched session; None if it has expired
+        if url is None or time() - self.launched_at >= self.SESSION_TTL:
+            return None
+        try:
+            r = self.auth_get(url)
+        except CanvasException:
+            return None
+        # an expired session is answered with a redirect to a login page
+        (asked, got) = (parse.urlsplit(url), parse.urlsplit(r.url))
+        if not r.ok or got.netloc != asked.netloc or 'login' in got.path.lower():
+            return None
+        return r
 
-    def get_summary(self):
-        r1 = self.follow_sessionless_url()
-        soup1 = BeautifulSoup(r1.text, 'html.parser')
+    def calendar(self):
+        from aplus import CalendarPage
 
-        summarylink = soup1.find(class_='stv_tt_title').find('a')
-        summaryurl = parse.urljoin(r1.url, summarylink.attrs['href'])
+        since = self.launched_at
+        r = self.session_get(self.calendar_url)
+        if r is not None:
+            return CalendarPage(r.text, r.url)
 
-        r2 = self.auth_get(summaryurl)
-        assert r2.ok
+        self.relaunch(since)
+        with self.launch_lock:
+            (page, self.landing) = (self.landing, None)
+        if page is None: # taken by a concurrent call
+            r = self.auth_get(self.calendar_url)
+            page = CalendarPage(r.text, r.url)
+        return page
 
-        soup2 = BeautifulSoup(r2.text, 'html.parser')
-        return str(soup2.find(id='content'))
+    def get_summary(self):
+        from aplus import summary_html
 
-    def get_events(self):
-        r = self.follow_sessionless_url()
-        soup = BeautifulSoup(r.text, 'html.parser')
-        days = soup.find_all(class_='dayPanel')
-
-        events = []
-        for d in days:
-            lis = d.find_all('li')
-            if len(lis) > 0:
-                for li in lis:
-                    date = datetime.strptime(d.attrs['id'], 'dayPanel_%d_%b_%y')
-                    datestr = date.isoformat()
-                    frag = date.strftime('%d_%b_%y').lstrip('0')
-                    url = parse.urlunsplit(parse.urlsplit(r.url)._replace(fragment=frag))
-                    text = li.text.strip()
-                    classes = li.find('i').attrs['class']
-
-
-                    valid = True
-                    if 'fa-check' in classes:
-                        status = 'recorded'
-                        submit_link = None
-                    elif 'fa-question' in classes:
-                        link = li.find('a')
-                        if link is not None:
-                            status = 'open'
-
-                            urlparts = parse.urlsplit(r.url)
-                            rel_link = link.attrs['href']
-                            submit_link = parse.urlunsplit(
-                                parse.urlsplit(rel_link)._replace(
-                                    scheme=urlparts.scheme,
-                                    netloc=urlparts.netloc,
-                                    path=urlparts.path
-                                    )
-                            )
-
-                        else:
-                            status = 'missed'
-                            submit_link = None
-                    else:
-                        print('Unrecognized aPlus html item classes: {}'.format(classes))
-                        valid = False
+        since = self.launched_at
+        r = self.session_get(self.summary_url)
+        if r is None:
+            self.relaunch(since)
+            r = self.auth_get(self.summary_url)
+            assert r.ok
 
-                    if valid:
-                        events.append(SimpleNamespace(text=text, due_at=datestr, status=status, url=url, link=submit_link))
-                    
+        html = summary_html(r.text)
+        self.summary = (html, time())
+        return html
+
+    def prefetch_summary(self):
+        try:
+            self.get_summary()
+        except Exception:
+            pass # fetched again when displayed
 
-        return events
+    def get_events(self):
+        return self.calendar().events()
 
     def expand(self, **kwargs):
+        threading.Thread(target=self.prefetch_summary, daemon=True).start()
         evs = self.get_events()
 
         for ev in evs:
@@ -931,12 +1341,16 @@ class APlusAttendanceItem(TabItem):
             self.append_item_row(item)
 
         if len(evs) == 0:
-            self.setEnabled(False)
+            BRIDGE.call(self.setEnabled, False)
 
         super().expand(**kwargs)
 
     def display(self, **kwargs):
-        disp_html(self.get_summary(), title=self.text(), parent=self.course().gui)
+        if self.summary is not None and time() - self.summary[1] < self.SESSION_TTL:
+            html = self.summary[0]
+        else:
+            html = self.get_summary()
+        disp_html(html, title=self.text(), parent=self.course().gui)
 
     def dblClickFcn(self, **kwargs):
         self.expand(**kwargs)
@@ -952,54 +1366,56 @@ class APlusEventItem(CustomItem):
         super().__init__(*args, **kwargs)
 
         self.setText(self.obj.text)
+        self.set_status(self.obj.status)
+
+    def set_status(self, status):
+        self.obj.status = status
 
-        if self.obj.status == 'open':
+        if status == 'open':
             self.setIcon(QIcon(ResourceFile('icons/open.png')))
-            self.CONTEXT_MENU_ACTIONS.extend([
-                {'displayname': 'Record Attendance', 'function': self.record_attendance, 'multiitem': True}
-            ])
-        elif self.obj.status == 'missed':
+        elif status == 'missed':
             self.setIcon(QIcon(ResourceFile('icons/missed.png')))
-        elif self.obj.status == 'recorded':
+        elif status == 'recorded':
             self.setIcon(QIcon(ResourceFile('icons/recorded.png')))
 
+        self.CONTEXT_MENU_ACTIONS = []
+        if status == 'open':
+            self.CONTEXT_MENU_ACTIONS.extend([
+                {'displayname': 'Record Attendance', 'function': self.record_attendance, 'multiitem': True}
+            ])
         self.CONTEXT_MENU_ACTIONS.extend([
             {'displayname': 'Open', 'function': self.open, 'multiitem': True}
         ])
 
         self.update_context_menu()
 
-    def record_attendance(self):
+    def record_attendance(self, **kwargs):
+        from aplus import attendance_form
+
         if self.obj.link is not None:
             r1 = self.parent().auth_get(self.obj.link)
             assert r1.ok
 
             if r1.url != self.obj.url: # test if this link "went anywhere"
-                soup = BeautifulSoup(r1.text, 'html.parser')
-                form = soup.find('form', id='ctl00')
-                data = {i.attrs['name']: i.attrs.get('value', '') for i in form.find_all('input')}
-
-                urlparts = parse.urlsplit(r1.url)
-                rel_link = form.attrs['action']
-                dest = parse.urlunsplit(
-                    parse.urlsplit(rel_link)._replace(
-                        scheme=urlparts.scheme,
-                        netloc=urlparts.netloc,
-                        path=urlparts.path
-                        )
-                )
+                form = attendance_form(r1.text, r1.url)
+                if form is None:
+                    self.print('No attendance form found for event {}.'.format(self.obj.text))
+                    return None
 
+                (dest, data) = form
                 r2 = self.parent().auth_post(dest, data)
                 assert r2.ok
 
                 self.print('Attendance recorded for event {}.'.format(self.obj.text))
 
-                self.parent().reexpand()
+                # update this row in place (no need to reload the calendar)
+                self.obj.link = None
+                self.set_status('recorded')
+                self.parent().summary = None
 
             else:
                 return None
 
-
     def identifier(self):
         return self.obj.text
 
@@ -1035,32 +1451,101 @@ class ModuleItem(CanvasItem):
     class for tree elements with corresponding canvasapi "module" objects
     """
     def __init__(self, *args, **kwargs):
+        # module items may be preloaded (with content attached) by the graphql backend
+        self.items = kwargs.pop('items', None)
+
         super().__init__(*args, **kwargs)
 
         self.CONTEXT_MENU_ACTIONS.extend([
-            {'displayname': 'Download Module', 'function': self.download, 'multiitem': True}
+            {'displayname': 'Download Module', 'function': self.download, 'multiitem': True},
+            {'displayname': 'Export Download Plan', 'function': self.export_plan, 'multiitem': False}
         ])
         self.update_context_menu()
 
         self.setIcon(QIcon(ResourceFile('icons/module.png')))
 
+        self.prefetched = {}
+        self.loading = False
+
+    def prefetch_content(self, items):
+        # with the asyncio engine, request every item's content at once
+        # (raises CancelledError if the module is collapsed meanwhile)
+        self.prefetched = {}
+        if not ENGINE.enabled:
+            return
+
+        course = self.course().obj
+        wanted = {}
+        for mi in items:
+            spec = MODULE_CONTENT.get(mi.type)
+            if spec is not None and getattr(mi, 'content', None) is None:
+                (method, attr, path, cls, add_course_id) = spec
+                id = getattr(mi, attr)
+                wanted[path.format(course.id, id)] = (method, id, cls, add_course_id)
+
+        for (path, js) in ENGINE.get_many(list(wanted), owner=self).items():
+            if isinstance(js, Exception):
+                continue # retried (and reported) by the plain request in module_content
+            (method, id, cls, add_course_id) = wanted[path]
+            if add_course_id:
+                js['course_id'] = course.id
+            self.prefetched[(method, id)] = cls(course._requester, js)
+
+    def module_content(self, mi, method, id):
+        # use content attached by the graphql backend (or prefetched) if present
+        content = getattr(mi, 'content', None)
+        if content is not None:
+            return content
+        content = self.prefetched.get((method, id))
+        if content is not None:
+            return content
+        return self.course().safe_get_item(method, id)
+
     def expand(self, **kwargs):
-        items = list(self.obj.get_module_items(include='content_details'))
+        # with the asyncio engine, content is awaited on a worker thread (so that
+        # collapsing can cancel it) and rows stream in through BRIDGE
+        if ENGINE.enabled and self.collecting is None and not kwargs.get('wait', False) and on_gui_thread():
+            if not self.loading:
+                self.loading = True
+                threading.Thread(target=self.load_items, daemon=True).start()
+        else:
+            self.add_items()
+
+        super().expand(**kwargs)
+
+    def load_items(self):
+        try:
+            self.add_items()
+        finally:
+            self.loading = False
+
+    def add_items(self):
+        if self.items is not None:
+            items = self.items
+            self.items = None # preloaded items are only fresh once
+        else:
+            items = list(paginated(self.obj.get_module_items, include='content_details'))
+
+        try:
+            self.prefetch_content(items)
+        except CancelledError:
+            return # collapsed before the content arrived
+
         for mi in items:
             if mi.type == 'SubHeader':
                 pass
             elif mi.type == 'File':
-                file = self.course().safe_get_item('get_file', mi.content_id)
+                file = self.module_content(mi, 'get_file', mi.content_id)
                 if file:
                     item = FileItem(object=file)
                     self.append_item_row(item)
             elif mi.type == 'Page':
-                page = self.course().safe_get_item('get_page', mi.page_url)
+                page = self.module_content(mi, 'get_page', mi.page_url)
                 if page:
                     item = PageItem(object=page)
                     self.append_item_row(item)
             elif mi.type == 'Discussion':
-                disc = self.course().safe_get_item('get_discussion_topic', mi.content_id)
+                disc = self.module_content(mi, 'get_discussion_topic', mi.content_id)
                 if disc:
                     if disc.discussion_type == 'threaded':
                         item = DiscussionItem(object=disc)
@@ -1071,12 +1556,12 @@ class ModuleItem(CanvasItem):
                         item = ModuleItemItem(object=disc)
                     self.append_item_row(item)
             elif mi.type == 'Quiz':
-                quiz = self.course().safe_get_item('get_quiz', mi.content_id)
+                quiz = self.module_content(mi, 'get_quiz', mi.content_id)
                 if quiz:
                     item = QuizItem(object=quiz)
                     self.append_item_row(item)
             elif mi.type == 'Assignment':
-                assignment = self.course().safe_get_item('get_assignment', mi.content_id)
+                assignment = self.module_content(mi, 'get_assignment', mi.content_id)
                 if assignment:
                     item = AssignmentItem(object=assignment)
                     self.append_item_row(item)
@@ -1090,40 +1575,16 @@ class ModuleItem(CanvasItem):
                 self.append_item_row(item)
 
         if len(items) == 0:
-            self.setEnabled(False)
-
-        super().expand(**kwargs)
+            BRIDGE.call(self.setEnabled, False)
 
     def dblClickFcn(self, **kwargs):
         self.expand(**kwargs)
 
-    def download(self, **kwargs):
-        loc = kwargs.get('location', self.course().downloadfolder)
-        confirm = kwargs.get('confirm', True)
-
-        if confirm:
-            confirmed = confirm_dialog('Download contents of {}?'.format(self.name),
-                title='Confirm Download',
-                parent=self.course().gui
-            )
-        else:
-            confirmed = True
+    def plan_download(self, plan, relpath):
+        self.plan_children(plan, relpath)
 
-        if confirmed:
-            # pathlib will not accept folder names with slashes
-            # pathlib replaces colons with slashes in macOS
-            # macOS does not allow colons in path names
-            # (so there is no way to get pathlib to insert colons)
-            safename = self.name.replace('/', ':')
-            folderpath = Path(loc) / safename
-
-            if folderpath.exists():
-                self.print('Folder {0} already exists at {1}; module not downloaded.'.format(self.name, loc))
-            else:
-                folderpath.mkdir()
-                self.expand()
-                for ch in self.children():
-                    ch.download(location=folderpath, confirm=False) # works for both files and folders!
+    def download(self, **kwargs):
+        self.download_tree(**kwargs)
 
 class ModuleItemItem(CanvasItem):
     """
@@ -1153,11 +1614,14 @@ class FolderItem(CanvasItem):
     """
     class for tree elements with corresponding canvasapi "folder" objects
     """
+    ORDERED_LISTING = True
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.CONTEXT_MENU_ACTIONS.extend([
-            {'displayname': 'Download Folder', 'function': self.download, 'multiitem': True}
+            {'displayname': 'Download Folder', 'function': self.download, 'multiitem': True},
+            {'displayname': 'Export Download Plan', 'function': self.export_plan, 'multiitem': False}
         ])
         self.update_context_menu()
 
@@ -1179,27 +1643,11 @@ class FolderItem(CanvasItem):
     def dblClickFcn(self, **kwargs):
         self.expand(**kwargs)
 
-    def download(self, **kwargs):
-        loc = kwargs.get('location', self.course().downloadfolder)
-        confirm = kwargs.get('confirm', True)
-
-        if confirm:
-            confirmed = confirm_dialog('Download contents of {}?'.format(self.name),
-                title='Confirm Download',
-                parent=self.course().gui
-            )
-        else:
-            confirmed = True
-
-        folderpath = Path(loc) / self.name
+    def plan_download(self, plan, relpath):
+        self.plan_children(plan, relpath)
 
-        if folderpath.exists():
-            self.print('Folder {0} already exists at {1}; not downloaded.'.format(self.name, loc))
-        else:
-            folderpath.mkdir()
-            self.expand()
-            for ch in self.children():
-                ch.download(location=folderpath, confirm=False) # works for both files and folders!
+    def download(self, **kwargs):
+        self.download_tree(**kwargs)
 
 class FileItem(CanvasItem):
     """
@@ -1217,19 +1665,41 @@ class FileItem(CanvasItem):
 
         self.setEnabled(not self.obj.locked_for_user)
 
+    def store_key(self):
+        return FileStore.make_key(self.obj.id, getattr(self.obj, 'uuid', None), getattr(self.obj, 'updated_at', None))
+
     # this is a faster version of the CanvasAPI's download method (not sure why...)
-    def save_data(self, filepath): # STREAM DOWNLOAD
+    def save_data(self, store, filepath): # STREAM DOWNLOAD
         auth_header = {"Authorization": "Bearer {}".format(self.obj._requester.access_token)}
-        r = requests.get(self.obj.url, headers=auth_header, stream=True)
+        r = CLIENT.get(self.obj.url, headers=auth_header, stream=True)
 
         if r.ok:
-            d = DownloadDialog(self.course().gui, filepath=filepath, request=r)
-            d.accepted.connect(lambda: self.print('{} downloaded.'.format(filepath.name)))
+            key = self.store_key()
+            d = DownloadDialog(self.course().gui, filepath=store.partial(key), request=r, displayname=filepath.name)
+            d.accepted.connect(lambda: self.stored(store, filepath))
             d.rejected.connect(lambda: self.print('Download of {} aborted.'.format(filepath.name)))
             d.show()
         else:
             self.print('Download of {0} failed (error code {1}: "{2}").'.format(filepath.name, r.status_code, r.reason))
 
+    def stored(self, store, filepath):
+        store.commit(self.store_key())
+        store.materialize(self.store_key(), filepath, overwrite=True) # replacing was confirmed
+        store.prune()
+        self.print('{} downloaded.'.format(filepath.name))
+        self.offer_conversion(filepath)
+
+    def offer_conversion(self, filepath):
+        gui = self.course().gui
+        if filepath.suffix in CONVERTIBLE_EXTENSIONS and gui.conversions.available():
+            if confirm_dialog('Convert {} to PDF?'.format(filepath.name),
+                title='Convert File',
+                yesno=True,
+                parent=gui
+            ):
+                gui.conversions.submit([filepath])
+                self.print('{} queued for conversion to PDF.'.format(filepath.name))
+
     def download(self, **kwargs):
         loc = kwargs.get('location', self.course().downloadfolder)
         confirm = kwargs.get('confirm', True)
@@ -1245,24 +1715,30 @@ class FileItem(CanvasItem):
         if confirmed:
             filename = parse.unquote(self.obj.filename)
             newpath = Path(loc) / filename # build local file Path obj
-            if not newpath.exists():
-                self.save_data(newpath)
+            if newpath.exists() and not (confirm and confirm_dialog('{} already exists. Replace it?'.format(filename),
+                title='Replace File', yesno=True, parent=self.course().gui
+            )):
+                self.print('{} already exists (not replaced).'.format(filename))
+                return
+            store = FileStore.for_root(self.course().downloadfolder)
+            if store.has(self.store_key()):
+                # this version was downloaded before (maybe elsewhere): link it
+                store.materialize(self.store_key(), newpath, overwrite=True)
+                self.print('{} restored from earlier download.'.format(filename))
+                self.offer_conversion(newpath)
             else:
-                self.print('{0} already exists at {1}; file not replaced.'.format(newpath.name, loc))
-
-            if newpath.suffix in CONVERTIBLE_EXTENSIONS:
-                if confirm_dialog('Convert {} to PDF?'.format(filename),
-                    title='Convert File',
-                    yesno=True,
-                    parent=self.course().gui
-                ):
-                    convert(newpath)
-                    os.remove(newpath)
-                    self.print('{} converted to a PDF.'.format(filename))
+                self.save_data(store, newpath)
 
     def dblClickFcn(self, **kwargs):
         self.download()
 
+    def plan_download(self, plan, relpath):
+        if self.isEnabled():
+            plan.add_file(self.obj, relpath / parse.unquote(self.obj.filename))
+
+    def search_text(self):
+        return parse.unquote(getattr(self.obj, 'filename', ''))
+
 class PageItem(CanvasItem):
     """
     class for tree elements with corresponding canvasapi "page" objects
@@ -1272,52 +1748,43 @@ class PageItem(CanvasItem):
 
         self.CONTEXT_MENU_ACTIONS.extend([
             {'displayname': 'Display HTML', 'function': self.display, 'multiitem': False},
-            {'displayname': 'Download Page Contents', 'function': self.download, 'multiitem': True}
+            {'displayname': 'Download Page Contents', 'function': self.download, 'multiitem': True},
+            {'displayname': 'Export Download Plan', 'function': self.export_plan, 'multiitem': False}
         ])
         self.update_context_menu()
 
         self.setIcon(QIcon(ResourceFile('icons/html.png')))
 
+    def search_text(self):
+        # never triggers a fetch; pages without a body are indexed by name
+        return getattr(self.obj, 'body', None)
+
+    def body(self):
+        # pages built by the graphql backend come without a body
+        if not hasattr(self.obj, 'body'):
+            page = self.course().safe_get_item('get_page', self.obj.page_id)
+            if page:
+                self.obj = page
+        return getattr(self.obj, 'body', None)
+
     def expand(self, **kwargs):
-        self.children_from_html(self.obj.body, **kwargs)
+        self.children_from_html(self.body(), **kwargs)
         super().expand(**kwargs)
 
     def dblClickFcn(self, **kwargs):
         self.expand(**kwargs)
 
     def display(self, **kwargs):
-        if self.obj.body:
-            disp_html(self.obj.body, title=self.name, parent=self.course().gui)
+        if self.body():
+            disp_html(self.body(), title=self.name, parent=self.course().gui)
         else:
             self.print('No content on page.')
 
-    def download(self, **kwargs):
-        loc = kwargs.get('location', self.course().downloadfolder)
-        confirm = kwargs.get('confirm', True)
-
-        if confirm:
-            confirmed = confirm_dialog('Download contents of {}?'.format(self.name),
-                title='Confirm Download',
-                parent=self.course().gui
-            )
-        else:
-            confirmed = True
+    def plan_download(self, plan, relpath):
+        self.plan_children(plan, relpath)
 
-        if confirmed:
-            # pathlib will not accept folder names with slashes
-            # pathlib replaces colons with slashes in macOS
-            # macOS does not allow colons in path names
-            # (so there is no way to get pathlib to insert colons)
-            safename = self.name.replace('/', ':')
-            folderpath = Path(loc) / safename
-
-            if folderpath.exists():
-                self.print('Folder {0} already exists at {1}; module not downloaded.'.format(self.name, loc))
-            else:
-                folderpath.mkdir()
-                self.expand()
-                for ch in self.children():
-                    ch.download(location=folderpath, confirm=False) # works for both files and folders!
+    def download(self, **kwargs):
+        self.download_tree(**kwargs)
 
 class QuizItem(CanvasItem):
     """
@@ -1366,6 +1833,9 @@ class DiscussionItem(CanvasItem):
     def display(self, **kwargs):
         disp_html(self.obj.message, title=self.text(), parent=self.course().gui)
 
+    def search_text(self):
+        return self.obj.message
+
 class AnnouncementItem(CanvasItem):
     """
     class for tree elements with corresponding canvasapi "discussiontopic" objects
@@ -1378,6 +1848,13 @@ class AnnouncementItem(CanvasItem):
 
         self.init_from_obj()
 
+    def refresh_display(self):
+        super().refresh_display()
+        self.init_from_obj()
+
+    def search_text(self):
+        return self.obj.message
+
     def init_from_obj(self):
 
         if self.obj.read_state == 'read':
@@ -1404,8 +1881,13 @@ class AnnouncementItem(CanvasItem):
             ])
             self.setIcon(QIcon(ResourceFile('icons/announcement_unread_blue.png')))
 
+        self.set_bold(self.needs_attention())
+
         self.update_context_menu()
 
+    def needs_attention(self):
+        return super().needs_attention() or not self.is_read
+
     def refresh(self):
         newobj = self.course().obj.get_discussion_topic(self.obj)
         self.obj = newobj
@@ -1448,6 +1930,9 @@ class AssignmentItem(CanvasItem):
         self.children_from_html(self.obj.description, **kwargs)
         super().expand(**kwargs)
 
+    def search_text(self):
+        return getattr(self.obj, 'description', None)
+
     def dblClickFcn(self, **kwargs):
         self.expand(**kwargs)
 
@@ -1469,6 +1954,23 @@ CONTENT_TYPES = [
     {'tag': 'announcements', 'displayname': 'Announcements', 'subclass': CourseAnnouncementsItem}
 ]
 
+# module item type -> (course method, attribute holding the id, api path, canvasapi class, needs course_id)
+MODULE_CONTENT = {
+    'File': ('get_file', 'content_id', 'courses/{0}/files/{1}', File, False),
+    'Page': ('get_page', 'page_url', 'courses/{0}/pages/{1}', Page, True),
+    'Discussion': ('get_discussion_topic', 'content_id', 'courses/{0}/discussion_topics/{1}', DiscussionTopic, True),
+    'Quiz': ('get_quiz', 'content_id', 'courses/{0}/quizzes/{1}', Quiz, True),
+    'Assignment': ('get_assignment', 'content_id', 'courses/{0}/assignments/{1}', Assignment, False)
+}
+
+# tool tabs that need a web login, and the items shown once it succeeds
+WEB_TOOL_LOGINS = {'Echo360': 'echo360', 'aPlus+ Attendance': 'canvas'}
+WEB_TOOL_ITEMS = {'Echo360': Echo360Item, 'aPlus+ Attendance': APlusAttendanceItem}
+
+def recent_activity(topic):
+    # the key discussion topics are ordered by with order_by='recent_activity'
+    return getattr(topic, 'last_reply_at', None) or getattr(topic, 'posted_at', None)
+
 # ----------------------------------------------------------------------
 
 class DateItem(QStandardItem):
@@ -1479,8 +1981,12 @@ class DateItem(QStandardItem):
 
     def __init__(self, *args, **kwargs):
         self.item = kwargs.pop('item')
+        datestr = kwargs.pop('datestr', None)
         super().__init__(*args, **kwargs)
-        self.datetime = self.datetime_from_obj(self.item.obj)
+        if datestr is None:
+            self.datetime = self.datetime_from_obj(self.item.obj)
+        else: # empty string means "known to have no date"
+            self.datetime = isoparse(datestr).astimezone(self.TIMEZONE) if datestr else None
 
         self.setFlags(Qt.ItemIsSelectable | Qt.ItemIsEnabled)
 
@@ -1491,6 +1997,11 @@ class DateItem(QStandardItem):
     def run_context_menu(self, point):
         self.item.run_context_menu(point)
 
+    def set_datetime(self, dt):
+        self.datetime = dt
+        self.setData(self.as_qdt(), CanvasItem.SORTROLE)
+        self.setText(self.smart_formatted())
+
     @staticmethod
     def hasattr_not_none(obj, attr):
     # check if has attr and also if that attr is not-None
@@ -1554,10 +2065,79 @@ class DateItem(QStandardItem):
 
 # ----------------------------------------------------------------------
 
+class NameIndex(object):
+    """
+    lowercase names of all rows in the model, numbered in load order,
+    each with the serials of its ancestors (course first, itself last)
+    so a match can mark its parents visible without walking the tree
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.names = [] # serial -> lowercase name (None once removed)
+            self.lineage = [] # serial -> tuple of serials, course ... self
+            self.generation = getattr(self, 'generation', 0) + 1 # stale serials after a model reset
+
+    def serial(self, item):
+        # index on demand, parents first
+        with self.lock:
+            if getattr(item, 'name_serial', None) is not None and item.name_generation == self.generation:
+                return item.name_serial
+            parent = item.parent()
+            up = self.lineage[self.serial(parent)] if parent is not None else ()
+            item.name_serial = len(self.names)
+            item.name_generation = self.generation
+            self.names.append(item.text().lower())
+            self.lineage.append(up + (item.name_serial,))
+            return item.name_serial
+
+    def name(self, serial):
+        return self.names[serial] or ''
+
+    def add_subtree(self, item):
+        # children appended before the item joined the model never signalled
+        self.serial(item)
+        for r in range(item.rowCount()):
+            self.add_subtree(item.child(r, 0))
+
+    def remove_subtree(self, item):
+        with self.lock:
+            if getattr(item, 'name_serial', None) is not None and item.name_generation == self.generation:
+                self.names[item.name_serial] = None
+                item.name_serial = None
+        for r in range(item.rowCount()):
+            self.remove_subtree(item.child(r, 0))
+
+    def rename(self, item):
+        # returns True if the indexed name changed
+        if not isinstance(item, CustomItem):
+            return False
+        with self.lock:
+            serial = self.serial(item)
+            name = item.text().lower()
+            if self.names[serial] == name:
+                return False
+            self.names[serial] = name
+            return True
+
+    def snapshot(self):
+        with self.lock:
+            return (list(self.names), list(self.lineage))
+
 class CustomProxyModel(QSortFilterProxyModel):
     """
     this subclass implements filtering and sorting functions for the app
+
+    the name filter marks every row that matches, or has a matching
+    descendant, in a bitmap over NameIndex serials, so filterAcceptsRow
+    stays a lookup no matter how much of the tree is loaded
     """
+    indexChanged = pyqtSignal()
+
+    FILTER_DELAY = 200 # ms to wait for typing to pause before refiltering
 
     def __init__(self, *args, **kwargs):
         # set defaults
@@ -1570,6 +2150,81 @@ class CustomProxyModel(QSortFilterProxyModel):
 
         self.setSortRole(CanvasItem.SORTROLE)
 
+        self.names = NameIndex()
+        self.NAME_FILTER = '' # filter text being applied
+        self.pending_filter = '' # filter text typed, applied after FILTER_DELAY
+        self.matches = None # serials matching NAME_FILTER
+        self.visible = bytearray() # serial -> 1 if the row matches or has a matching descendant
+        self.filtered_count = 0 # names indexed at the last filter pass
+
+        self.filterTimer = QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(self.FILTER_DELAY)
+        self.filterTimer.timeout.connect(self.apply_name_filter)
+        self.indexChanged.connect(self.index_changed)
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        # direct connections: rows are often added from worker threads,
+        # and must be indexed before they are filtered
+        model.rowsInserted.connect(self.rows_inserted, Qt.DirectConnection)
+        model.rowsAboutToBeRemoved.connect(self.rows_removed, Qt.DirectConnection)
+        model.itemChanged.connect(self.item_changed, Qt.DirectConnection)
+        model.modelReset.connect(self.names.reset, Qt.DirectConnection)
+
+    def rows_inserted(self, parentindex, first, last):
+        parent = self.filtering_parent(parentindex)
+        for row in range(first, last + 1):
+            self.names.add_subtree(parent.child(row, 0))
+        if self.NAME_FILTER:
+            self.indexChanged.emit()
+
+    def rows_removed(self, parentindex, first, last):
+        parent = self.filtering_parent(parentindex)
+        for row in range(first, last + 1):
+            self.names.remove_subtree(parent.child(row, 0))
+
+    def item_changed(self, item):
+        if self.names.rename(item) and self.NAME_FILTER:
+            self.indexChanged.emit()
+
+    def index_changed(self):
+        # new or renamed rows may reveal hidden parents; refilter once things settle
+        self.matches = None # renamed rows can match anew, so rescan everything
+        if not self.filterTimer.isActive():
+            self.pending_filter = self.NAME_FILTER
+            self.filterTimer.start()
+
+    def name_filter_changed(self, text):
+        self.pending_filter = text.strip().lower()
+        self.filterTimer.start() # restarts while typing
+
+    def apply_name_filter(self):
+        text = self.pending_filter
+        if not text:
+            self.matches = None
+            self.visible = bytearray()
+        else:
+            (names, lineage) = self.names.snapshot()
+            if self.matches is not None and self.NAME_FILTER and text.startswith(self.NAME_FILTER):
+                # narrowing the filter: only previous matches and newly indexed rows can match
+                candidates = self.matches + list(range(self.filtered_count, len(names)))
+            else:
+                candidates = range(len(names))
+            self.matches = [s for s in candidates if names[s] is not None and text in names[s]]
+
+            visible = bytearray(len(names))
+            for s in self.matches:
+                for a in reversed(lineage[s]): # self first, then up to the course
+                    if visible[a]:
+                        break # ancestors already marked by an earlier match
+                    visible[a] = 1
+            self.visible = visible
+            self.filtered_count = len(names)
+
+        self.NAME_FILTER = text
+        self.invalidateFilter()
+
     def only_favorites_changed(self, newval):
         self.ONLY_FAVORITES = newval
         self.invalidateFilter() # signal that filtering param changed
@@ -1584,18 +2239,28 @@ class CustomProxyModel(QSortFilterProxyModel):
         self.invalidateFilter()
 
 
-    def filtering_item(self, row, parentindex, column=0):
+    def filtering_parent(self, parentindex):
         # tricky thing here is that "parentindex" correspondes 
         # to (invalid) root item for top level items, and so
         # we can't get the parent item via model->itemFromIndex
         source = self.sourceModel()
         # handle top level item case explicitly
         if parentindex == source.invisibleRootItem().index():
-            parent = source.invisibleRootItem()
+            return source.invisibleRootItem()
         else:
-            parent = source.itemFromIndex(parentindex)
+            return source.itemFromIndex(parentindex)
 
-        return parent.child(row, column)
+    def filtering_item(self, row, parentindex, column=0):
+        return self.filtering_parent(parentindex).child(row, column)
+
+    def name_accept(self, item):
+        if not self.NAME_FILTER:
+            return True
+        serial = self.names.serial(item)
+        if serial < len(self.visible):
+            return bool(self.visible[serial])
+        # loaded since the last filter pass (a refilter is already queued)
+        return self.NAME_FILTER in self.names.name(serial)
 
     def filterAcceptsRow(self, row, parentindex):
         item = self.filtering_item(row, parentindex)
@@ -1612,7 +2277,7 @@ class CustomProxyModel(QSortFilterProxyModel):
 
         content_accept = item.course().CONTENT_TYPE_INDEX == self.CONTENT_TYPE_INDEX
 
-        return all([favorite_accept, term_accept, content_accept])
+        return all([favorite_accept, term_accept, content_accept]) and self.name_accept(item)
 
 # ---------------------------- CUSTOM WIDGETS -----------------------------
 
@@ -1798,6 +2463,44 @@ class CustomPushButton(QPushButton):
     def toolTipString(self):
         return self.curreButton
 
+class SearchBox(QLineEdit):
+    """
+    line edit showing search index matches as you type
+    emits the lineage path of the chosen result
+    """
+    resultChosen = pyqtSignal(list)
+    PathRole = Qt.UserRole + 1
+
+    def __init__(self, *args, **kwargs):
+        self.index = kwargs.pop('index')
+        super().__init__(*args, **kwargs)
+
+        self.setPlaceholderText('Search loaded content')
+        self.setClearButtonEnabled(True)
+
+        self.results = QStandardItemModel(self)
+        self.completer = QCompleter(self.results, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.setWidget(self)
+        self.completer.activated[QModelIndex].connect(self.resultActivated)
+
+        self.textEdited.connect(self.update_results)
+
+    def update_results(self, text):
+        self.results.clear()
+        for (name, kind, path) in self.index.search(text):
+            item = QStandardItem(name)
+            item.setToolTip(kind.replace('Item', ''))
+            item.setData(path, self.PathRole)
+            self.results.appendRow(item)
+        if self.results.rowCount() > 0:
+            self.completer.complete()
+        else:
+            self.completer.popup().hide()
+
+    def resultActivated(self, index):
+        self.resultChosen.emit(index.data(self.PathRole))
+
 class CustomStyledItemDelegate(QStyledItemDelegate):
     """
     Fixes issue with macOS checkbox in qcombobox styling
@@ -0,0 +1,67 @@
+# conversion.py
+import os
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from appcontrol import default_converter
+
+class ConversionQueue(QObject):
+    """
+    converts downloaded office files to pdf in the background
+
+    files are queued once they exist (after their download finished) and
+    handed to the converter in batches by at most MAX_WORKERS threads
+    (office applications do not take kindly to parallel automation)
+    """
+    converted = pyqtSignal(str, str, float) # input path, error message ('' if converted), seconds taken
+
+    MAX_WORKERS = 1
+
+    def __init__(self, converter=None, parent=None):
+        super().__init__(parent)
+        self.converter = converter if converter is not None else default_converter()
+        self.lock = threading.Lock()
+        self.pending = [] # (path, remove_original)
+        self.workers = 0
+        self.timings = [] # (filename, seconds) of every conversion this session
+
+    def available(self):
+        return self.converter is not None
+
+    def submit(self, paths, remove_original=True):
+        with self.lock:
+            self.pending.extend((str(p), remove_original) for p in paths)
+            start = min(self.MAX_WORKERS - self.workers, len(self.pending))
+            self.workers += start
+        for _ in range(start):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    def work(self):
+        while True:
+            with self.lock:
+                batch = self.pending[:self.converter.BATCH_SIZE]
+                del self.pending[:len(batch)]
+                if not batch:
+                    self.workers -= 1
+                    return
+
+            remove = dict(batch)
+
+            def report(path, error, seconds):
+                if error is None and remove[path]:
+                    os.remove(path)
+                with self.lock:
+                    self.timings.append((os.path.basename(path), seconds))
+                self.converted.emit(path, error or '', seconds)
+
+            try:
+                self.converter.convert_batch(list(remove), report)
+            except Exception as e:
+                for path in remove:
+                    self.converted.emit(path, str(e), 0.0)
+
+    def close(self):
+        # stop long-lived converter processes (see LibreOfficeListener)
+        if hasattr(self.converter, 'close'):
+            self.converter.close()
@@ -0,0 +1,606 @@
+# downloads.py
+import os
+import re
+import stat
+import sys
+import csv
+import json
+import math
+import shutil
+import subprocess
+import hashlib
+import threading
+from time import time, sleep
+from pathlib import Path
+from urllib import parse
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from locations import CacheFile
+
+MANIFEST_NAME = '.canvasmirror.json'
+
+STORE_NAME = '.canvasstore'
+
+STORE_MAX_BYTES = 2 * 2**30 # for blobs that no downloaded file shares (see FileStore.prune)
+
+MAX_PARALLEL = 4 # simultaneous file transfers per job
+
+CHUNK_SIZE = 2**16
+
+PLAN_VERSION = 1
+
+# transfer rate assumed (bytes/s) until one has been measured
+DEFAULT_THROUGHPUT = 2e6
+
+# headers each kind of url needs on top of the requester's session cookies
+def auth_headers(requester):
+    return {
+        'canvas': {'Authorization': 'Bearer {}'.format(requester.access_token)},
+        'echo360': {} # echo360 authenticates with session cookies
+    }
+
+def si_ify_size(number):
+    if not number:
+        return '0 B'
+    prefixes = ['', 'k', 'M', 'G', 'T']
+    pow10 = min(math.floor(math.log10(number)), 3 * (len(prefixes) - 1))
+    prefix = prefixes[pow10 // 3]
+    quantity = number / (10 ** (3 * (pow10 // 3)))
+    return '{0:.1f} {1}B'.format(quantity, prefix)
+
+def format_duration(seconds):
+    if seconds < 60:
+        return '{} sec'.format(max(1, round(seconds)))
+    elif seconds < 3600:
+        return '{} min'.format(round(seconds / 60))
+    else:
+        return '{0:.1f} hrs'.format(seconds / 3600)
+
+def safe_name(name):
+    # pathlib will not accept folder names with slashes
+    # pathlib replaces colons with slashes in macOS
+    # macOS does not allow colons in path names
+    # (so there is no way to get pathlib to insert colons)
+    return name.replace('/', ':')
+
+if sys.platform == 'darwin':
+    CLONE_COMMAND = ['cp', '-c'] # apfs clonefile
+else:
+    CLONE_COMMAND = ['cp', '--reflink=always']
+
+def clone(source, dest):
+    # copy-on-write copy (shares blocks until either file is edited)
+    try:
+        return subprocess.run(CLONE_COMMAND + [str(source), str(dest)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0
+    except OSError:
+        return False
+
+def link_or_copy(source, dest, read_only=False):
+    # reflink if the filesystem can, hard link or copy otherwise; a hard link
+    # shares edits with source, so with read_only it is made read-only
+    # (clones and copies are always writable)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + '.part')
+    if tmp.exists():
+        tmp.unlink()
+    linked = False
+    if not clone(source, tmp):
+        try:
+            os.link(str(source), str(tmp))
+            linked = True
+        except OSError:
+            shutil.copy2(str(source), str(tmp))
+    mode = stat.S_IMODE(os.stat(str(tmp)).st_mode)
+    if not linked:
+        os.chmod(str(tmp), mode | stat.S_IWUSR)
+    elif read_only:
+        os.chmod(str(tmp), mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+    tmp.replace(dest)
+
+class ThroughputMeter(object):
+    """
+    moving average of measured download rates, kept across sessions
+    """
+    WEIGHT = 0.3 # of the newest measurement
+
+    def __init__(self, path=None):
+        self.path = path if path is not None else CacheFile('throughput.json')
+        self.lock = threading.Lock()
+        self.rate = None
+        try:
+            with open(str(self.path), 'r') as fobj:
+                self.rate = json.load(fobj).get('rate')
+        except (OSError, ValueError):
+            pass
+
+    def add(self, nbytes, seconds):
+        if nbytes < 2**20 or seconds <= 0:
+            return # too little to be meaningful
+        with self.lock:
+            measured = nbytes / seconds
+            if self.rate is None:
+                self.rate = measured
+            else:
+                self.rate = self.WEIGHT * measured + (1 - self.WEIGHT) * self.rate
+            try:
+                with open(str(self.path), 'w') as fobj:
+                    json.dump({'rate': self.rate}, fobj)
+            except OSError:
+                pass
+
+    def estimate(self, nbytes):
+        return nbytes / (self.rate or DEFAULT_THROUGHPUT)
+
+THROUGHPUT = ThroughputMeter()
+
+class RateLimiter(object):
+    """
+    token bucket shared by a job's transfer threads; rate in bytes/s
+    (None for no limit), with up to a second's worth of burst
+    """
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.tokens = rate or 0
+        self.stamp = time()
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time()
+            self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate) - nbytes
+            self.stamp = now
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            sleep(wait)
+
+def strip_verifier(url):
+    # exported plans carry no file access tokens (the auth header is enough for canvas)
+    parts = parse.urlsplit(url)
+    query = [(k, v) for (k, v) in parse.parse_qsl(parts.query, keep_blank_values=True) if k != 'verifier']
+    return parse.urlunsplit(parts._replace(query=parse.urlencode(query)))
+
+class PlannedFile(object):
+    """
+    one remote file and every relative path it should appear at
+    """
+    def __init__(self, key, url, relpath, size=None, updated_at=None, auth='canvas', version=None, info=None):
+        self.id = key
+        self.url = url
+        self.size = size
+        self.updated_at = updated_at
+        self.auth = auth # key into auth_headers
+        self.version = version # uuid / etag, if the server gives one
+        self.info = info # extra catalog columns (see DownloadPlan.add_catalog)
+        self.relpaths = [relpath]
+
+    @property
+    def store_key(self):
+        return FileStore.make_key(self.id, self.version, self.updated_at)
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'url': self.url, 'size': self.size, 'updated_at': self.updated_at,
+            'auth': self.auth, 'version': self.version, 'info': self.info,
+            'paths': [str(p) for p in self.relpaths]
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        paths = [Path(p) for p in d['paths']]
+        planned = cls(d['id'], d['url'], paths[0], d.get('size'), d.get('updated_at'),
+            d.get('auth', 'canvas'), d.get('version'), d.get('info')
+        )
+        planned.relpaths = paths
+        return planned
+
+class FileStore(object):
+    """
+    content-addressed copies of downloaded files, kept in a hidden folder
+    of the download folder; the files users see are links (or clones)
+    of these, so a file linked from many places is stored once and a
+    repeat download of an unchanged file is a local link
+
+    blobs are named by remote id + version, and identical content under
+    different names is stored once (sha256 index); one instance per
+    folder (see for_root), so concurrent downloads share the index;
+    blobs that take space of their own are capped (see prune)
+    """
+    KEY_RE = re.compile(r'[^\w.-]+')
+
+    SHARED = {} # resolved root -> FileStore
+    SHARED_LOCK = threading.Lock()
+
+    @classmethod
+    def for_root(cls, root):
+        key = str(Path(root).resolve())
+        with cls.SHARED_LOCK:
+            if key not in cls.SHARED:
+                cls.SHARED[key] = cls(root)
+            return cls.SHARED[key]
+
+    def __init__(self, root):
+        self.folder = Path(root) / STORE_NAME
+        self.lock = threading.Lock()
+        self.hashes = {} # sha256 -> key of first blob with that content
+        self.hashfile = self.folder / 'hashes.json'
+        try:
+            with open(str(self.hashfile), 'r') as fobj:
+                self.hashes = json.load(fobj)
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def make_key(cls, fid, version, updated_at):
+        parts = [str(p) for p in (fid, version, updated_at) if p is not None]
+        return cls.KEY_RE.sub('_', '-'.join(parts))
+
+    def path(self, key):
+        return self.folder / key
+
+    def has(self, key):
+        return self.path(key).is_file()
+
+    def partial(self, key):
+        # where a download of key should be written (see commit)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        return self.folder / (key + '.part')
+
+    def commit(self, key, sha256=None):
+        # move a finished partial download into place, deduplicating by content
+        part = self.partial(key)
+        if sha256 is None:
+            h = hashlib.sha256()
+            with open(str(part), 'rb') as fobj:
+                for chunk in iter(lambda: fobj.read(CHUNK_SIZE), b''):
+                    h.update(chunk)
+            sha256 = h.hexdigest()
+
+        with self.lock:
+            same = self.hashes.get(sha256)
+            duplicate = same is not None and same != key and self.has(same)
+            if duplicate:
+                part.unlink()
+                link_or_copy(self.path(same), self.path(key))
+            else:
+                part.replace(self.path(key))
+                self.hashes[sha256] = key
+            self.save_locked()
+        return duplicate
+
+    def save_locked(self):
+        tmp = self.hashfile.with_suffix('.tmp')
+        with open(str(tmp), 'w') as fobj:
+            json.dump(self.hashes, fobj)
+        tmp.replace(self.hashfile)
+
+    def materialize(self, key, dest, overwrite=False):
+        # a clone, else a read-only hard link (editing it must not change the blob), else a copy
+        dest = Path(dest)
+        if dest.exists() and not overwrite:
+            raise FileExistsError('{} already exists'.format(dest.name))
+        link_or_copy(self.path(key), dest, read_only=True)
+        if os.stat(str(self.path(key))).st_nlink == 1:
+            os.utime(str(self.path(key))) # recently used (see prune)
+
+    def prune(self, max_bytes=STORE_MAX_BYTES):
+        # blobs hard-linked to a downloaded file take no space of their own; the
+        # others (copies, or left by deleted or superseded files) are evicted
+        # least recently used first once they add up to more than max_bytes
+        with self.lock:
+            if not self.folder.is_dir():
+                return
+            blobs = []
+            for p in self.folder.iterdir():
+                if p == self.hashfile or p.suffix in ('.part', '.tmp'):
+                    continue
+                st = p.stat()
+                if st.st_nlink == 1:
+                    blobs.append((st.st_mtime, st.st_size, p))
+            total = sum(size for (_, size, _) in blobs)
+            for (_, size, p) in sorted(blobs):
+                if total <= max_bytes:
+                    break
+                p.unlink()
+                total -= size
+            self.hashes = {h: key for (h, key) in self.hashes.items() if self.has(key)}
+            self.save_locked()
+
+class DownloadPlan(object):
+    """
+    everything a download operation will write, gathered before any
+    transfer starts (see CustomItem.plan_download)
+
+    files are keyed by id (canvas file id, or "echo360:<kind>:" media id), so a
+    file linked from several pages or modules is fetched once and linked
+    to its other locations; a plan can be exported to json and run later
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+        self.files = {} # id -> PlannedFile
+        self.folders = []
+        self.catalogs = [] # (folder relpath, catalog name, [file ids])
+        self.max_rate = None # bytes/s for the whole job, None for no limit
+
+    def add_folder(self, relpath):
+        self.folders.append(relpath)
+
+    def add_file(self, obj, relpath):
+        # a canvasapi File
+        self.add_url(str(obj.id), obj.url, relpath,
+            size=getattr(obj, 'size', None),
+            updated_at=getattr(obj, 'updated_at', None),
+            version=getattr(obj, 'uuid', None)
+        )
+
+    def add_url(self, key, url, relpath, size=None, updated_at=None, auth='canvas', version=None, info=None):
+        planned = self.files.get(key)
+        if planned is None:
+            self.files[key] = PlannedFile(key, url, relpath, size, updated_at, auth, version, info)
+        elif relpath not in planned.relpaths:
+            planned.relpaths.append(relpath)
+
+    def add_catalog(self, relpath, name, keys):
+        # json + csv listing of the given files (their info, size and path), written after the run
+        self.catalogs.append((relpath, name, list(keys)))
+
+    def __len__(self):
+        return len(self.files)
+
+    def summary(self):
+        # what running this plan would do (nothing is fetched)
+        store = FileStore.for_root(self.root)
+        present = [f for f in self.files.values() if store.has(f.store_key)]
+        total_bytes = sum(f.size or 0 for f in self.files.values())
+        present_bytes = sum(f.size or 0 for f in present)
+        return {
+            'files': len(self.files),
+            'present': len(present),
+            'unknown_size': sum(1 for f in self.files.values() if f.size is None),
+            'total_bytes': total_bytes,
+            'present_bytes': present_bytes,
+            'eta': THROUGHPUT.estimate(total_bytes - present_bytes)
+        }
+
+    def describe(self):
+        s = self.summary()
+        text = '{files} file(s), {total}; {present} file(s) ({present_size}) already downloaded.'.format(
+            total=si_ify_size(s['total_bytes']), present_size=si_ify_size(s['present_bytes']), **s
+        )
+        if s['files'] > s['present']:
+            text += '\nAbout {} to download'.format(format_duration(s['eta']))
+            if s['unknown_size'] > 0:
+                text += ' (plus {} file(s) of unknown size)'.format(s['unknown_size'])
+            text += '.'
+        return text
+
+    def export(self, path):
+        plan = {
+            'version': PLAN_VERSION,
+            'root': str(self.root),
+            'folders': [str(p) for p in self.folders],
+            'files': [dict(f.to_dict(), url=strip_verifier(f.url)) for f in self.files.values()],
+            'catalogs': [[str(rel), name, keys] for (rel, name, keys) in self.catalogs],
+            'max_rate': self.max_rate
+        }
+        with open(str(path), 'w') as fobj:
+            json.dump(plan, fobj, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        with open(str(path), 'r') as fobj:
+            d = json.load(fobj)
+        if d.get('version') != PLAN_VERSION:
+            raise ValueError('Unsupported download plan version.')
+        plan = cls(d['root'])
+        plan.folders = [Path(p) for p in d['folders']]
+        plan.catalogs = [(Path(rel), name, keys) for (rel, name, keys) in d.get('catalogs', [])]
+        plan.max_rate = d.get('max_rate')
+        for f in d['files']:
+            planned = PlannedFile.from_dict(f)
+            plan.files[planned.id] = planned
+        return plan
+
+class Manifest(object):
+    """
+    record of what a mirror folder holds, stored in the folder itself:
+    remote id -> updated_at, size, store key, relative paths written and
+    which of those were since converted to pdf (original removed)
+
+    one instance per folder (see for_root), so jobs and conversions
+    update the same entries
+    """
+    SHARED = {} # resolved root -> Manifest
+    SHARED_LOCK = threading.Lock()
+
+    @classmethod
+    def for_root(cls, root):
+        key = str(Path(root).resolve())
+        with cls.SHARED_LOCK:
+            if key not in cls.SHARED:
+                cls.SHARED[key] = cls(root)
+            return cls.SHARED[key]
+
+    def __init__(self, root):
+        self.path = Path(root) / MANIFEST_NAME
+        self.lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(str(self.path), 'r') as fobj:
+                self.entries = json.load(fobj).get('files', {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with self.lock:
+            tmp = self.path.with_suffix('.tmp')
+            with open(str(tmp), 'w') as fobj:
+                json.dump({'files': self.entries}, fobj, indent=1)
+            tmp.replace(self.path)
+
+    def materialized(self, planned, relpath, root):
+        # True if relpath already holds the current version of planned (or its pdf)
+        with self.lock:
+            entry = self.entries.get(planned.id)
+            if entry is None or entry.get('key') != planned.store_key or str(relpath) not in entry['paths']:
+                return False
+            converted = str(relpath) in entry.get('converted', [])
+        if converted:
+            return (root / relpath).with_suffix('.pdf').is_file()
+        return (root / relpath).is_file()
+
+    def record(self, planned):
+        with self.lock:
+            old = self.entries.get(planned.id, {})
+            paths = [str(p) for p in planned.relpaths]
+            self.entries[planned.id] = {
+                'updated_at': planned.updated_at,
+                'size': planned.size,
+                'key': planned.store_key,
+                'paths': paths
+            }
+            if old.get('key') == planned.store_key: # same version: still converted
+                converted = [p for p in old.get('converted', []) if p in paths]
+                if converted:
+                    self.entries[planned.id]['converted'] = converted
+
+    def owns(self, relpath):
+        # True if relpath was written by this mirror
+        with self.lock:
+            return any(str(relpath) in entry['paths'] for entry in self.entries.values())
+
+    def record_conversion(self, relpath):
+        # relpath was converted to pdf and removed
+        with self.lock:
+            for entry in self.entries.values():
+                if str(relpath) in entry['paths']:
+                    converted = entry.setdefault('converted', [])
+                    if str(relpath) not in converted:
+                        converted.append(str(relpath))
+
+class MirrorJob(QObject):
+    """
+    carries out a DownloadPlan with a bounded pool of transfer threads
+
+    files go through the FileStore: versions already stored are not
+    fetched again, and every planned path is a link to the stored copy
+    """
+    progress = pyqtSignal(int, int) # files done, files total
+    message = pyqtSignal(str)
+    finished = pyqtSignal(dict)
+
+    RUNNING = set() # keeps jobs alive until they finish
+
+    def __init__(self, plan, requester, parent=None):
+        super().__init__(parent)
+        self.plan = plan
+        self.session = requester._session
+        self.headers = auth_headers(requester)
+        self.manifest = Manifest.for_root(plan.root)
+        self.store = FileStore.for_root(plan.root)
+        self.limiter = RateLimiter(plan.max_rate)
+        self.lock = threading.Lock()
+        self.done = 0
+        self.nbytes = 0
+        self.written = [] # paths (re)written by this job
+        self.counts = {'downloaded': 0, 'unchanged': 0, 'linked': 0, 'failed': 0}
+
+    def start(self):
+        MirrorJob.RUNNING.add(self)
+        self.finished.connect(lambda _: MirrorJob.RUNNING.discard(self))
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        for rel in self.plan.folders:
+            (self.plan.root / rel).mkdir(parents=True, exist_ok=True)
+
+        start = time()
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL) as pool:
+            for planned in self.plan.files.values():
+                pool.submit(self.fetch_one, planned)
+        THROUGHPUT.add(self.nbytes, time() - start)
+
+        self.manifest.save()
+        self.write_catalogs()
+        self.store.prune()
+        self.finished.emit(dict(self.counts))
+
+    def write_catalogs(self):
+        for (rel, name, keys) in self.plan.catalogs:
+            rows = []
+            for key in keys:
+                planned = self.plan.files[key]
+                row = dict(planned.info or {})
+                row.update({
+                    'size': planned.size,
+                    'file': os.path.relpath(str(planned.relpaths[0]), str(rel)),
+                    'archived': self.store.has(planned.store_key)
+                })
+                rows.append(row)
+
+            folder = self.plan.root / rel
+            try:
+                folder.mkdir(parents=True, exist_ok=True)
+                with open(str(folder / '{}.json'.format(name)), 'w') as fobj:
+                    json.dump(rows, fobj, indent=1)
+                columns = []
+                for row in rows:
+                    columns.extend(c for c in row if c not in columns)
+                with open(str(folder / '{}.csv'.format(name)), 'w', newline='') as fobj:
+                    writer = csv.DictWriter(fobj, fieldnames=columns)
+                    writer.writeheader()
+                    writer.writerows(rows)
+            except OSError as e:
+                self.message.emit('Could not write {0} catalog ({1}).'.format(name, e))
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+            self.done += 1
+            done = self.done
+        self.progress.emit(done, len(self.plan))
+
+    def fetch_one(self, planned):
+        root = self.plan.root
+        key = planned.store_key
+        try:
+            if self.store.has(key):
+                result = 'unchanged'
+            else:
+                duplicate = self.fetch(planned, key)
+                result = 'linked' if duplicate else 'downloaded'
+
+            for rel in planned.relpaths:
+                if not self.manifest.materialized(planned, rel, root):
+                    # only files this mirror wrote before are replaced, never the user's own
+                    self.store.materialize(key, root / rel, overwrite=self.manifest.owns(rel))
+                    with self.lock:
+                        self.written.append(root / rel)
+
+            self.manifest.record(planned)
+            self.count(result)
+        except FileExistsError as e:
+            self.message.emit('{} was not written over (not from this mirror).'.format(e))
+            self.count('failed')
+        except Exception as e:
+            self.message.emit('Download of {0} failed ({1}).'.format(planned.relpaths[0].name, e))
+            self.count('failed')
+
+    def fetch(self, planned, key):
+        # stream into the store, hashing along the way
+        r = self.session.get(planned.url, headers=self.headers[planned.auth], stream=True)
+        r.raise_for_status()
+
+        h = hashlib.sha256()
+        with open(str(self.store.partial(key)), 'wb') as fobj:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                h.update(chunk)
+                fobj.write(chunk)
+                with self.lock:
+                    self.nbytes += len(chunk)
+                self.limiter.consume(len(chunk))
+        return self.store.commit(key, h.hexdigest())
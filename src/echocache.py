@@ -0,0 +1,45 @@
+# echocache.py
+import json
+import threading
+
+from locations import CacheFile
+
+class Echo360Cache(object):
+    """
+    lesson media json already fetched from echo360, per section
+    (media of a published lesson rarely changes, and fetching it is one
+    request per lesson)
+    """
+    def __init__(self, path=None):
+        self.path = path if path is not None else CacheFile('echo360media.json')
+        self.lock = threading.Lock()
+        self.sections = {} # section id -> {lesson id: media json}
+        try:
+            with open(str(self.path), 'r') as fobj:
+                self.sections = json.load(fobj)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, section_id, lesson_id):
+        with self.lock:
+            return self.sections.get(section_id, {}).get(lesson_id)
+
+    def put(self, section_id, lesson_id, media):
+        with self.lock:
+            self.sections.setdefault(section_id, {})[lesson_id] = media
+
+    def prune(self, section_id, lesson_ids):
+        # forget lessons no longer in the syllabus
+        with self.lock:
+            section = self.sections.get(section_id, {})
+            for lid in set(section) - set(lesson_ids):
+                del section[lid]
+
+    def save(self):
+        with self.lock:
+            tmp = self.path.with_suffix('.tmp')
+            with open(str(tmp), 'w') as fobj:
+                json.dump(self.sections, fobj)
+            tmp.replace(self.path)
+
+ECHO360_CACHE = Echo360Cache()
@@ -0,0 +1,127 @@
+# echorecord.py
+import re
+import json
+
+try:
+    import orjson # optional, several times faster on large media blobs
+except ImportError:
+    orjson = None
+
+DURATION_RE = re.compile(r'PT([\d\.]+)S')
+
+DOWNLOAD_PROFILES = [
+    {'tag': 'hd', 'displayname': 'HD Video'},
+    {'tag': 'sd', 'displayname': 'SD Video'},
+    {'tag': 'audio', 'displayname': 'Audio Only'},
+    {'tag': 'original', 'displayname': 'Original Upload'},
+    {'tag': 'auto', 'displayname': 'Smallest Video at Resolution'}
+]
+
+RESOLUTIONS = [360, 480, 720, 1080] # video heights offered for the "auto" profile
+
+def loads(data):
+    # parse json (str or bytes), using orjson when installed
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class MediaFile(object):
+    """
+    one rendition of a lecture (video, audio or original upload)
+    """
+    __slots__ = ('name', 'size', 'width', 'height')
+
+    def __init__(self, name=None, size=0, width=None, height=None):
+        self.name = name
+        self.size = size
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def from_json(cls, js, size_key='size'):
+        return cls(js.get('name'), js.get(size_key) or 0, js.get('width'), js.get('height'))
+
+    def to_list(self):
+        return [self.name, self.size, self.width, self.height]
+
+class LectureRecord(object):
+    """
+    the fields of an echo360 lesson media blob the app actually uses,
+    extracted once (the blob itself is not kept)
+    """
+    __slots__ = (
+        'lesson_id', 'name', 'created_at', 'updated_at', 'media_id', 'duration',
+        'original', 'videos', 'audio'
+    )
+
+    @classmethod
+    def from_media(cls, js):
+        rec = cls()
+        lesson = js['lesson']
+        media = js['video']['media']
+        current = media['media']['current']
+
+        rec.lesson_id = lesson['id']
+        rec.name = lesson['name']
+        rec.created_at = lesson['createdAt']
+        rec.updated_at = lesson.get('updatedAt')
+        rec.media_id = media['id']
+
+        m = DURATION_RE.match(current.get('duration') or '')
+        rec.duration = round(float(m.group(1))) if m else 0
+
+        rec.original = MediaFile.from_json(media['media'].get('originalFile') or {}, size_key='sizeInBytes')
+        videos = [MediaFile.from_json(f) for f in current.get('primaryFiles') or []]
+        rec.videos = tuple(sorted(videos, key=lambda f: f.size, reverse=True)) # largest first
+        rec.audio = tuple(MediaFile.from_json(f) for f in current.get('audioFiles') or [])
+        return rec
+
+    def to_dict(self):
+        return {
+            'lesson_id': self.lesson_id, 'name': self.name,
+            'created_at': self.created_at, 'updated_at': self.updated_at,
+            'media_id': self.media_id, 'duration': self.duration,
+            'original': self.original.to_list(),
+            'videos': [f.to_list() for f in self.videos],
+            'audio': [f.to_list() for f in self.audio]
+        }
+
+    def signature(self):
+        # compared by sync when a lesson has no updatedAt (see sync.signature)
+        return self.to_dict()
+
+    @classmethod
+    def from_dict(cls, d):
+        rec = cls()
+        for k in ('lesson_id', 'name', 'created_at', 'updated_at', 'media_id', 'duration'):
+            setattr(rec, k, d[k])
+        rec.original = MediaFile(*d['original'])
+        rec.videos = tuple(MediaFile(*f) for f in d['videos'])
+        rec.audio = tuple(MediaFile(*f) for f in d['audio'])
+        return rec
+
+    def rendition(self, profile, resolution=720):
+        """
+        returns (profile, kind, MediaFile, server file name) for a download
+        profile; "auto" is the smallest video at least resolution pixels
+        tall (the largest if none is); profiles with no matching file
+        fall back to hd
+        """
+        if profile == 'audio' and self.audio:
+            return ('audio', 'audio', self.audio[0], self.audio[0].name or 'audio.m4a')
+        if profile == 'original' and self.original.name:
+            return ('original', 'original', self.original, self.original.name)
+        if profile == 'sd' and len(self.videos) > 1:
+            return ('sd', 'video', self.videos[1], self.videos[1].name or 'sd1.mp4')
+        if profile == 'auto' and self.videos:
+            tall_enough = [v for v in self.videos if (v.height or 0) >= resolution]
+            chosen = min(tall_enough, key=lambda v: v.size) if tall_enough else self.videos[0]
+            default = 'hd1.mp4' if chosen is self.videos[0] else 'sd1.mp4'
+            return ('auto', 'video', chosen, chosen.name or default)
+        hd = self.videos[0] if self.videos else MediaFile()
+        return ('hd', 'video', hd, hd.name or 'hd1.mp4')
+
+    @classmethod
+    def load(cls, d):
+        # accepts a compact dict (to_dict) or a raw media blob
+        return cls.from_dict(d) if 'lesson_id' in d else cls.from_media(d)
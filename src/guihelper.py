@@ -1,7 +1,6 @@
 # guihelper.py
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
-from PyQt5.Qt import *
 from PyQt5.QtCore import *
 
 import os, sys
@@ -130,6 +129,7 @@ class DownloadDialog(QDialog):
     def __init__(self, *args, **kwargs):
         self.filepath = kwargs.pop('filepath')
         self.request = kwargs.pop('request')
+        self.displayname = kwargs.pop('displayname', self.filepath.name)
 
         super().__init__(*args, **kwargs)
 
@@ -144,7 +144,7 @@ class DownloadDialog(QDialog):
         self.mainlayout = QVBoxLayout()
 
         self.captionLayout = QHBoxLayout()
-        self.captionLabel = QLabel('Downloading {} ...'.format(self.filepath.name))
+        self.captionLabel = QLabel('Downloading {} ...'.format(self.displayname))
         self.captionLayout.addWidget(self.captionLabel)
         self.captionLayout.setAlignment(Qt.AlignCenter)
 
@@ -28,6 +28,13 @@ DOWNLOADS = HOME / 'Downloads'
 
 DOCUMENTS = HOME / 'Documents'
 
+# hidden folder for snapshots, caches, etc. (created on first use)
+CACHE = HOME / '.canvascache'
+
+def CacheFile(name):
+    CACHE.mkdir(exist_ok=True)
+    return CACHE / name
+
 if IS_BUNDLED:
     # set up app to write to logfile
     with open(ResourceFile(LOGFILE), 'w') as file:
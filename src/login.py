@@ -1,12 +1,13 @@
 # login.py
 
-import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlsplit, urlunsplit, unquote
 from pathlib import Path
 
 import keyring
 
+from network import CLIENT
+
 import json
 import re
 
@@ -30,7 +31,7 @@ def get_formdata(formelem):
 def auth_canvas_session(credential, baseurl, sess=None):
     # make new session only existing not provided
     if sess is None:
-        sess = requests.Session()
+        sess = CLIENT.new_session()
 
     try:
         parts = urlsplit(baseurl)
@@ -61,7 +62,7 @@ def auth_canvas_session(credential, baseurl, sess=None):
 def auth_echo_session(credential, sess=None):
     # make new session only existing not provided
     if sess is None:
-        sess = requests.Session()
+        sess = CLIENT.new_session()
 
     try:
         url1 = 'https://login.echo360.org/login'
@@ -104,7 +105,7 @@ def auth_echo_session(credential, sess=None):
 def auth_session(sess=None):
     # make new session only existing not provided
     if sess is None:
-        sess = requests.Session()
+        sess = CLIENT.new_session()
 
     sess = auth_canvas_session(sess)
     sess = auth_echo_session(sess)
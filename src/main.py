@@ -4,12 +4,31 @@ from locations import *
 
 import sys
 
-from PyQt5.Qt import QApplication
+# first, so that every later import is timed (run with --trace)
+from startuptrace import TRACE
+TRACE.start()
 
-from app import CanvasApp
+from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QApplication, QSplashScreen
 
 app = QApplication(sys.argv)
-gui = CanvasApp()
+TRACE.mark('qt ready')
+
+# shown while the rest of the app is imported and built
+splash = QSplashScreen(QPixmap(ResourceFile('icons/splash.png')))
+splash.show()
+splash.showMessage('Loading...', Qt.AlignBottom | Qt.AlignHCenter)
+app.processEvents()
+TRACE.mark('splash shown')
+
+from network import CLIENT
+CLIENT.add_response_hook(TRACE.observe)
+
+from app import CanvasApp
+TRACE.mark('app imported')
+
+gui = CanvasApp(splash=splash)
 
 if __name__ == '__main__':
-    sys.exit(app.exec_()) # block until qapp instance exits
\ No newline at end of file
+    sys.exit(app.exec_()) # block until qapp instance exits
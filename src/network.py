@@ -0,0 +1,166 @@
+# network.py
+import weakref
+import threading
+from urllib import parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+DEFAULT_POOL_SIZE = 10
+
+# connections kept alive per host (keys are url prefixes, as used by Session.mount)
+POOL_SIZES = {
+    'https://echo360.org': 16,
+    'https://login.echo360.org': 2,
+}
+
+RETRY = Retry(
+    total=3,
+    backoff_factor=0.5, # sleeps 0.5, 1, 2 s between attempts
+    status_forcelist=[500, 502, 503, 504],
+    allowed_methods=['HEAD', 'GET', 'OPTIONS'], # never replay a POST
+    raise_on_status=False
+)
+
+class ConnectionCounter(object):
+    """
+    thread-safe tally of connections opened vs. requests sent
+    (every request not needing a new connection reused a pooled one)
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.created = 0
+        self.requests = 0
+
+    def connection_created(self):
+        with self.lock:
+            self.created += 1
+
+    def request_sent(self):
+        with self.lock:
+            self.requests += 1
+
+    def reused(self):
+        return max(self.requests - self.created, 0)
+
+class CountingAdapter(HTTPAdapter):
+    """
+    HTTPAdapter whose connection pools report each new connection to a counter
+    """
+    def __init__(self, counter, **kwargs):
+        self.counter = counter
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+
+        counter = self.counter
+
+        # count socket connects rather than pooled connection objects, since
+        # urllib3 silently reconnects a pooled connection the server dropped
+        class CountingHTTPConnection(HTTPConnection):
+            def connect(self):
+                counter.connection_created()
+                return super().connect()
+
+        class CountingHTTPSConnection(HTTPSConnection):
+            def connect(self):
+                counter.connection_created()
+                return super().connect()
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = CountingHTTPConnection
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = CountingHTTPSConnection
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+    def send(self, request, **kwargs):
+        self.counter.request_sent()
+        return super().send(request, **kwargs)
+
+class HttpClient(object):
+    """
+    owner of all pooled HTTP connections used by the app
+
+    sessions handed out by this class share the same adapters (and so the
+    same keep-alive connection pools), but each has its own cookie jar;
+    they are tracked (weakly) so later pool and hook changes reach them all
+    """
+    def __init__(self, pool_sizes=POOL_SIZES, default_size=DEFAULT_POOL_SIZE, retry=RETRY):
+        self.counter = ConnectionCounter()
+        self.retry = retry
+        self.default_size = default_size
+        self.adapters = {}
+        self.hooks = [] # response hooks for every session
+        self.sessions = weakref.WeakSet()
+        self.lock = threading.Lock()
+
+        for scheme in ['https://', 'http://']:
+            self.adapters[scheme] = self.make_adapter(default_size)
+        for (prefix, size) in pool_sizes.items():
+            self.adapters[prefix] = self.make_adapter(size)
+
+        self.default = self.new_session()
+
+    def make_adapter(self, size):
+        return CountingAdapter(
+            self.counter,
+            pool_connections=size,
+            pool_maxsize=size,
+            max_retries=self.retry
+        )
+
+    def mount(self, session):
+        for (prefix, adapter) in self.adapters.items():
+            session.mount(prefix, adapter)
+
+    def new_session(self):
+        sess = requests.Session()
+        sess.headers['Connection'] = 'keep-alive'
+        with self.lock:
+            self.mount(sess)
+            sess.hooks['response'].extend(self.hooks)
+            self.sessions.add(sess)
+        return sess
+
+    def add_response_hook(self, hook):
+        # called with every response, on every session (existing and later ones)
+        with self.lock:
+            self.hooks.append(hook)
+            for sess in list(self.sessions):
+                sess.hooks['response'].append(hook)
+
+    def set_pool_size(self, url, size):
+        # dedicate a pool (shared by all sessions) to the host of url
+        parts = parse.urlsplit(url)
+        prefix = parse.urlunsplit((parts.scheme, parts.netloc, '', '', ''))
+        with self.lock:
+            self.adapters[prefix] = self.make_adapter(size)
+            for sess in list(self.sessions):
+                self.mount(sess)
+
+    def attach(self, canvas):
+        # route a canvasapi Canvas instance through a pooled session of its own
+        # (cookies of one account or trial login never leak into another)
+        canvas._Canvas__requester._session = self.new_session()
+        return canvas
+
+    def get(self, url, **kwargs):
+        return self.default.get(url, **kwargs)
+
+    def stats(self):
+        return {
+            'created': self.counter.created,
+            'reused': self.counter.reused(),
+            'requests': self.counter.requests
+        }
+
+CLIENT = HttpClient()
@@ -0,0 +1,45 @@
+# pagination.py
+from concurrent.futures import ThreadPoolExecutor
+
+PER_PAGE = 100 # largest page size canvas will honor for most endpoints
+
+# pages of one listing are inherently serial (the next page url is only
+# known once the previous page has arrived), so each listing keeps at most
+# one page in flight; the pool is sized so listings do not wait on each other
+PREFETCH_WORKERS = 8
+
+PREFETCHER = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='prefetch')
+
+def stream(plist):
+    """
+    yield elements of a canvasapi PaginatedList page by page, requesting
+    the next page (from the "Link" header) while the current one is consumed
+
+    pages are added to the list's own element cache as they arrive,
+    so iterating the same PaginatedList again afterwards is free; a
+    page not yet started is cancelled when the generator is abandoned
+    """
+    # elements already cached by an earlier (partial) iteration
+    for element in list(plist._elements):
+        yield element
+
+    pending = PREFETCHER.submit(plist._grow) if plist._has_next() else None
+
+    try:
+        while pending is not None:
+            page = pending.result()
+            # _grow has already parsed the Link header, so the next url is known
+            pending = PREFETCHER.submit(plist._grow) if plist._has_next() else None
+            for element in page:
+                yield element
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+def paginated(method, *args, **kwargs):
+    """
+    call a canvasapi list method (e.g. course.get_modules) with
+    per_page tuned up, and stream its results
+    """
+    kwargs.setdefault('per_page', PER_PAGE)
+    return stream(method(*args, **kwargs))
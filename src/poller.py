@@ -0,0 +1,98 @@
+# poller.py
+import json
+import threading
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from canvasapi.exceptions import CanvasException
+from requests.exceptions import RequestException
+
+from scheduler import SCHEDULER, PRIORITY_BACKGROUND
+
+class ChangePoller(QObject):
+    """
+    periodically checks canvas activity summaries (cheap calls) and reports
+    which of the given courses have new activity
+
+    the check runs on a worker thread; results arrive via coursesChanged
+    on the gui thread. the interval doubles while nothing changes and
+    snaps back to the minimum as soon as something does
+    """
+    coursesChanged = pyqtSignal(list)
+
+    MIN_INTERVAL = 60 # seconds
+    MAX_INTERVAL = 15 * 60
+
+    def __init__(self, canvas, targets, parent=None):
+        super().__init__(parent)
+        self.canvas = canvas
+        self.requester = canvas._Canvas__requester
+        self.targets = targets # callable returning course ids worth checking
+
+        self.interval = self.MIN_INTERVAL
+        self.global_summary = None
+        self.course_summaries = {}
+        self.busy = False
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.poll)
+
+        self.coursesChanged.connect(self.adapt)
+
+    def start(self):
+        self.timer.start(self.interval * 1000)
+
+    def stop(self):
+        self.timer.stop()
+
+    def poll(self):
+        # gui thread: gather targets here, do the network work elsewhere
+        if not self.busy:
+            self.busy = True
+            course_ids = list(self.targets())
+            threading.Thread(target=self.check, args=(course_ids,), daemon=True).start()
+
+    def check(self, course_ids):
+        changed = []
+        try:
+            with SCHEDULER.priority(PRIORITY_BACKGROUND):
+                # courses seen for the first time (e.g. just expanded) get a baseline
+                # now, so their next change is noticed; dropped ones get a new one later
+                for cid in [cid for cid in self.course_summaries if cid not in course_ids]:
+                    del self.course_summaries[cid]
+                new = [cid for cid in course_ids if cid not in self.course_summaries]
+                self.changed_courses(new)
+
+                summary = self.signature(self.canvas.get_activity_stream_summary())
+                if summary != self.global_summary:
+                    first = self.global_summary is None
+                    self.global_summary = summary
+                    if not first: # first poll only establishes a baseline
+                        changed = self.changed_courses([cid for cid in course_ids if cid not in new])
+        except (CanvasException, RequestException) as e:
+            print('Change poll failed: {}'.format(e))
+        self.coursesChanged.emit(changed)
+
+    def changed_courses(self, course_ids):
+        changed = []
+        for cid in course_ids:
+            r = self.requester.request('GET', 'courses/{}/activity_stream/summary'.format(cid))
+            summary = self.signature(r.json())
+            previous = self.course_summaries.get(cid)
+            self.course_summaries[cid] = summary
+            if previous is not None and previous != summary:
+                changed.append(cid)
+        return changed
+
+    @staticmethod
+    def signature(summary):
+        return json.dumps(summary, sort_keys=True)
+
+    def adapt(self, changed):
+        self.busy = False
+        if changed:
+            self.interval = self.MIN_INTERVAL
+        else:
+            self.interval = min(self.MAX_INTERVAL, 2 * self.interval)
+        self.start()
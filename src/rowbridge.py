@@ -0,0 +1,95 @@
+# rowbridge.py
+import queue
+import threading
+from time import perf_counter
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+def on_gui_thread():
+    return threading.current_thread() is threading.main_thread()
+
+class RowBridge(QObject):
+    """
+    carries model changes from worker threads to the gui thread
+
+    workers post (function, args) descriptors on a queue; a timer on the
+    gui thread applies them in batches, stopping each batch after
+    BATCH_TIME so the event loop stays responsive; how late each batch
+    fires (timer lag) and how long rows wait are kept in stats()
+    """
+    INTERVAL = 15 # ms between batches
+    BATCH_TIME = 0.008 # seconds of model changes per batch
+
+    posted = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.timer = None
+        self.due = None # when the running timer should next fire
+        self.counts = {'applied': 0, 'batches': 0, 'max_wait': 0.0, 'max_lag': 0.0, 'total_lag': 0.0}
+        self.posted.connect(self.wake) # queued: wake runs on the gui thread
+
+    def post(self, fcn, *args):
+        self.queue.put((fcn, args, perf_counter()))
+        self.posted.emit()
+
+    def call(self, fcn, *args):
+        # run now if on the gui thread, otherwise in the next batch
+        if on_gui_thread():
+            fcn(*args)
+        else:
+            self.post(fcn, *args)
+
+    def flush(self):
+        # worker thread: wait until everything posted so far has been applied
+        if on_gui_thread():
+            return
+        done = threading.Event()
+        self.post(done.set)
+        done.wait()
+
+    def wake(self):
+        if self.timer is None:
+            self.timer = QTimer(self)
+            self.timer.timeout.connect(self.apply_batch)
+        if not self.timer.isActive():
+            self.due = perf_counter() + self.INTERVAL / 1000
+            self.timer.start(self.INTERVAL)
+
+    def apply_batch(self):
+        start = perf_counter()
+        lag = max(0.0, start - self.due)
+        self.due = start + self.INTERVAL / 1000
+
+        applied = 0
+        max_wait = 0.0
+        while perf_counter() - start < self.BATCH_TIME:
+            try:
+                (fcn, args, stamp) = self.queue.get_nowait()
+            except queue.Empty:
+                self.timer.stop()
+                break
+            max_wait = max(max_wait, start - stamp)
+            try:
+                fcn(*args)
+            except Exception as e:
+                print('Row update failed: {}'.format(e))
+            applied += 1
+
+        with self.lock:
+            self.counts['applied'] += applied
+            self.counts['batches'] += 1
+            self.counts['max_wait'] = max(self.counts['max_wait'], max_wait)
+            self.counts['max_lag'] = max(self.counts['max_lag'], lag)
+            self.counts['total_lag'] += lag
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+        counts['mean_lag'] = counts.pop('total_lag') / max(counts['batches'], 1)
+        counts['queued'] = self.queue.qsize()
+        return counts
+
+BRIDGE = RowBridge()
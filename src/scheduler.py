@@ -0,0 +1,157 @@
+# scheduler.py
+import threading
+import heapq
+import itertools
+import random
+from time import time, sleep
+from contextlib import contextmanager
+
+from canvasapi.exceptions import Forbidden
+
+# lower number = served first
+PRIORITY_USER = 0 # e.g. expanding an item the user clicked on
+PRIORITY_BACKGROUND = 10 # e.g. prefetching, polling
+
+class RequestScheduler(object):
+    """
+    central gate for all canvasapi requests
+
+    concurrency is adapted AIMD-style from canvas' rate limit headers:
+    the limit grows by about one slot per round of successful requests,
+    and is halved when X-Rate-Limit-Remaining runs low or a call is throttled
+    """
+    def __init__(self, min_limit=1, max_limit=16, initial_limit=4, low_water=100.0,
+        max_retries=5, backoff=1.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial_limit)
+        self.low_water = low_water # remaining quota below which we back off
+        self.max_retries = max_retries
+        self.backoff = backoff # seconds, doubled per retry
+
+        self.cond = threading.Condition()
+        self.waiting = [] # heap of (priority, sequence number)
+        self.counter = itertools.count()
+        self.active = 0
+
+        self.remaining = None # last seen X-Rate-Limit-Remaining
+        self.last_cost = None # last seen X-Request-Cost
+        self.last_decrease = 0
+        self.completed = 0
+        self.throttled = 0
+        self.retries = 0
+
+        self.local = threading.local()
+
+    def install(self, requester):
+        # wrap requester.request and watch every response on its session
+        original = requester.request
+
+        def scheduled_request(*args, **kwargs):
+            return self.run(original, *args, **kwargs)
+
+        requester.request = scheduled_request
+        if self.observe not in requester._session.hooks['response']:
+            requester._session.hooks['response'].append(self.observe)
+
+    @contextmanager
+    def priority(self, level):
+        # requests made by this thread inside the block are queued at level
+        previous = getattr(self.local, 'priority', PRIORITY_USER)
+        self.local.priority = level
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def acquire(self):
+        entry = (getattr(self.local, 'priority', PRIORITY_USER), next(self.counter))
+        with self.cond:
+            heapq.heappush(self.waiting, entry)
+            while self.waiting[0] != entry or self.active >= int(self.limit):
+                self.cond.wait()
+            heapq.heappop(self.waiting)
+            self.active += 1
+            self.cond.notify_all() # next in line may also fit
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def run(self, fcn, *args, **kwargs):
+        attempt = 0
+        while True:
+            self.acquire()
+            try:
+                result = fcn(*args, **kwargs)
+            except Forbidden as e:
+                if not self.is_throttle(e) or attempt >= self.max_retries:
+                    raise
+                self.on_throttle()
+            else:
+                self.on_success()
+                return result
+            finally:
+                self.release()
+
+            attempt += 1
+            sleep(self.retry_delay(attempt))
+
+    def retry_delay(self, attempt):
+        # seconds before retry number attempt (full jitter keeps retrying
+        # threads from stampeding together)
+        with self.cond:
+            self.retries += 1
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    @staticmethod
+    def is_throttle(exc):
+        # canvas throttles with 403 (or 429) and this text in the body
+        return 'Rate Limit Exceeded' in str(exc)
+
+    def observe(self, response, *args, **kwargs):
+        # session response hook: record rate limit headers (canvas only)
+        remaining = response.headers.get('X-Rate-Limit-Remaining')
+        if remaining is not None:
+            with self.cond:
+                self.remaining = float(remaining)
+                self.last_cost = float(response.headers.get('X-Request-Cost', 0))
+        return response
+
+    def decrease(self):
+        # multiplicative decrease, at most once per second so that one
+        # burst of low-quota responses does not collapse the limit to 1
+        now = time()
+        if now - self.last_decrease > 1:
+            self.limit = max(self.min_limit, self.limit / 2)
+            self.last_decrease = now
+
+    def on_success(self):
+        with self.cond:
+            self.completed += 1
+            if self.remaining is not None and self.remaining < self.low_water:
+                self.decrease()
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+    def on_throttle(self):
+        with self.cond:
+            self.throttled += 1
+            self.decrease()
+
+    def state(self):
+        with self.cond:
+            return {
+                'limit': int(self.limit),
+                'active': self.active,
+                'queued': len(self.waiting),
+                'remaining': self.remaining,
+                'last_cost': self.last_cost,
+                'completed': self.completed,
+                'throttled': self.throttled,
+                'retries': self.retries
+            }
+
+SCHEDULER = RequestScheduler()
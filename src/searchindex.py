@@ -0,0 +1,158 @@
+# searchindex.py
+import re
+import json
+import sqlite3
+import threading
+from html import unescape
+
+from locations import CacheFile
+from sync import item_key
+
+TAG_RE = re.compile(r'<[^>]+>')
+SPACE_RE = re.compile(r'\s+')
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+COMMIT_EVERY = 200 # inserts between commits (reads see uncommitted rows anyway)
+
+BATCH_SIZE = 100 # rows queued by add before they are written in one go
+
+def html_to_text(html):
+    if not html:
+        return ''
+    return SPACE_RE.sub(' ', unescape(TAG_RE.sub(' ', html))).strip()
+
+class SearchIndex(object):
+    """
+    local full-text index of everything loaded into the tree
+
+    rows are keyed by the item's lineage (course -> ... -> item), so a
+    result can be located again in the model; uses sqlite's FTS5 when
+    available and falls back to a plain LIKE scan otherwise
+
+    added rows are queued and written in batches (so a listing of many
+    rows costs a few statements, not three per row); searching or
+    committing writes the queue first
+    """
+    def __init__(self, path=None):
+        self.path = path # default in the cache folder (see open_locked)
+        self.db = None # opened on first use, not at import
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.queued = {} # path -> (path, kind, name, body) not written yet
+        self.FTS = None
+
+    @property
+    def conn(self):
+        # only used with self.lock held
+        if self.db is None:
+            self.open_locked()
+        return self.db
+
+    def open_locked(self):
+        path = self.path if self.path is not None else CacheFile('search.sqlite')
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        try:
+            self.db.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS items USING fts5('
+                'path UNINDEXED, kind UNINDEXED, name, body, tokenize="unicode61")'
+            )
+            self.FTS = True
+        except sqlite3.OperationalError: # sqlite built without fts5
+            self.db.execute('CREATE TABLE IF NOT EXISTS items (path TEXT, kind TEXT, name TEXT, body TEXT)')
+            self.FTS = False
+        # path -> rowid lookup (fts tables cannot index the path column)
+        self.db.execute('CREATE TABLE IF NOT EXISTS paths (path TEXT PRIMARY KEY, docid INTEGER)')
+        self.db.commit()
+
+    @staticmethod
+    def item_path(item):
+        return json.dumps([item_key(i) for i in item.lineage()])
+
+    def add(self, item):
+        path = self.item_path(item)
+        entry = (path, type(item).__name__, item.text(), html_to_text(item.search_text()))
+        with self.lock:
+            self.queued[path] = entry
+            if len(self.queued) >= BATCH_SIZE:
+                self.flush_locked()
+
+    def flush_locked(self):
+        # replace the queued paths' rows, with rowids assigned here so both tables take executemany
+        if not self.queued:
+            return
+        entries = list(self.queued.values())
+        self.queued = {}
+        paths = [(entry[0],) for entry in entries]
+        self.conn.executemany('DELETE FROM items WHERE rowid IN (SELECT docid FROM paths WHERE path = ?)', paths)
+        self.conn.executemany('DELETE FROM paths WHERE path = ?', paths)
+        (last,) = self.conn.execute('SELECT COALESCE(MAX(docid), 0) FROM paths').fetchone()
+        rows = [(last + i + 1,) + entry for (i, entry) in enumerate(entries)]
+        self.conn.executemany('INSERT INTO items (rowid, path, kind, name, body) VALUES (?, ?, ?, ?, ?)', rows)
+        self.conn.executemany('INSERT INTO paths (docid, path) VALUES (?, ?)', [row[:2] for row in rows])
+        self.pending += len(rows)
+        if self.pending >= COMMIT_EVERY:
+            self.commit_locked()
+
+    def remove(self, item):
+        self.remove_path(self.item_path(item))
+
+    def remove_path(self, path):
+        with self.lock:
+            self.queued.pop(path, None)
+            self.delete_locked(path)
+            self.pending += 1
+
+    def clear(self):
+        # forget everything (the tree is reloaded, or belongs to another account)
+        with self.lock:
+            self.queued = {}
+            self.conn.execute('DELETE FROM items')
+            self.conn.execute('DELETE FROM paths')
+            self.commit_locked()
+
+    def delete_locked(self, path):
+        row = self.conn.execute('SELECT docid FROM paths WHERE path = ?', (path,)).fetchone()
+        if row is not None:
+            self.conn.execute('DELETE FROM items WHERE rowid = ?', row)
+            self.conn.execute('DELETE FROM paths WHERE path = ?', (path,))
+
+    def commit_locked(self):
+        if self.db is None:
+            return # nothing was ever written
+        self.db.commit()
+        self.pending = 0
+
+    def commit(self):
+        with self.lock:
+            self.flush_locked()
+            self.commit_locked()
+
+    def search(self, text, limit=50):
+        # returns [(name, kind, path list), ...], best matches first
+        tokens = TOKEN_RE.findall(text)
+        if not tokens:
+            return []
+
+        with self.lock:
+            self.flush_locked()
+            conn = self.conn # also tells whether fts5 is available
+            if self.FTS:
+                query = ' AND '.join('"{}"*'.format(t) for t in tokens) # prefix match each word
+                rows = conn.execute(
+                    'SELECT name, kind, path FROM items WHERE items MATCH ? ORDER BY rank LIMIT ?',
+                    (query, limit)
+                ).fetchall()
+            else:
+                where = ' AND '.join(['(name LIKE ? OR body LIKE ?)'] * len(tokens))
+                args = sum([['%{}%'.format(t)] * 2 for t in tokens], [])
+                rows = conn.execute(
+                    'SELECT name, kind, path FROM items WHERE {} LIMIT ?'.format(where),
+                    args + [limit]
+                ).fetchall()
+
+        return [(name, kind, json.loads(path)) for (name, kind, path) in rows]
+
+SEARCH = SearchIndex()
@@ -0,0 +1,142 @@
+# snapshot.py
+import gzip
+import json
+import hashlib
+import importlib
+from time import time
+from urllib import parse
+
+from canvasapi.canvas_object import CanvasObject
+
+import classdefs
+from classdefs import CourseItem, Echo360Item, Echo360LectureItem
+from locations import CacheFile
+from usercache import write_private
+
+SNAPSHOT_VERSION = 1
+
+JSON_TYPES = (str, int, float, bool, type(None), list, dict)
+
+def obj_to_dict(obj):
+    """
+    plain-data form of a canvasapi object (or SimpleNamespace)
+    derived attributes ("*_date" datetimes) and private ones are dropped,
+    they are rebuilt by canvasapi when the object is recreated
+    """
+    attrs = {}
+    for (k, v) in vars(obj).items():
+        if k.startswith('_') or k.endswith('_date'):
+            continue
+        if isinstance(v, JSON_TYPES):
+            attrs[k] = v
+    cls = type(obj)
+    return {'type': '{0}.{1}'.format(cls.__module__, cls.__qualname__), 'attrs': attrs}
+
+def obj_from_dict(d, requester):
+    modulename, _, clsname = d['type'].rpartition('.')
+    cls = getattr(importlib.import_module(modulename), clsname)
+    if issubclass(cls, CanvasObject):
+        return cls(requester, dict(d['attrs']))
+    else:
+        return cls(**d['attrs'])
+
+def snapshot_path(baseurl, token):
+    # one snapshot per account (keyed by a digest: the token is never written)
+    host = parse.urlsplit(baseurl).netloc or 'canvas'
+    digest = hashlib.sha256('{0}\n{1}'.format(baseurl, token).encode('utf-8')).hexdigest()[:16]
+    return CacheFile('snapshot-{0}-{1}.json.gz'.format(host, digest))
+
+class Snapshot(object):
+    """
+    compact on-disk copy of the course tree (everything loaded so far)
+    used to populate the gui instantly (or offline) at launch;
+    readable by the user only, like the profile cache
+    """
+    def __init__(self, baseurl, token):
+        self.path = snapshot_path(baseurl, token)
+        self.data = None
+
+    def exists(self):
+        return self.path.is_file()
+
+    def load(self):
+        if self.data is None and self.exists():
+            try:
+                with gzip.open(str(self.path), 'rt') as fobj:
+                    data = json.load(fobj)
+                if data.get('version') == SNAPSHOT_VERSION:
+                    self.data = data
+            except (OSError, ValueError):
+                self.data = None
+        return self.data
+
+    @property
+    def terms(self):
+        return self.load()['terms'] if self.load() else []
+
+    def save(self, gui):
+        root = gui.model.invisibleRootItem()
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'saved_at': time(),
+            'terms': gui.terms,
+            'courses': [self.item_to_dict(root.child(r, 0)) for r in range(root.rowCount())]
+        }
+        tmp = self.path.with_suffix('.tmp')
+        write_private(tmp, gzip.compress(json.dumps(data, separators=(',', ':')).encode('utf-8')))
+        tmp.replace(self.path) # never leave a half-written snapshot behind
+        self.data = data
+
+    def item_to_dict(self, item):
+        dt = item.date.datetime
+        # rows still streaming in are left out: the item is expanded again next time
+        loading = getattr(item, 'loading', False)
+        d = {
+            'class': type(item).__name__,
+            'date': dt.isoformat() if dt is not None else '',
+            'enabled': item.isEnabled() or loading,
+            'children': [] if loading else [self.item_to_dict(ch) for ch in item.children()]
+        }
+        if isinstance(item, Echo360LectureItem):
+            d['json'] = item.json
+        else:
+            d['object'] = obj_to_dict(item.obj)
+
+        if isinstance(item, CourseItem) and item.nickname is not None:
+            d['nickname'] = obj_to_dict(item.nickname)
+        if isinstance(item, Echo360Item):
+            d['state'] = item.saved_urls()
+
+        return d
+
+    def item_from_dict(self, d, requester):
+        cls = getattr(classdefs, d['class'])
+        kwargs = {'datestr': d['date']}
+        if 'json' in d:
+            kwargs['json'] = d['json']
+        else:
+            kwargs['object'] = obj_from_dict(d['object'], requester)
+        if 'state' in d:
+            kwargs['state'] = d['state']
+
+        item = cls(**kwargs)
+        self.restore_children(item, d, requester)
+        return item
+
+    def restore_children(self, item, d, requester):
+        item.setEnabled(d['enabled'])
+        for ch in d['children']:
+            item.append_item_row(self.item_from_dict(ch, requester))
+        if len(d['children']) > 0:
+            item.mark_expanded()
+
+    def restore(self, gui):
+        # rebuild the course items (and everything below them) into the gui model
+        requester = gui.canvas._Canvas__requester
+        for d in self.load()['courses']:
+            cls = getattr(classdefs, d['class'])
+            course = obj_from_dict(d['object'], requester)
+            nickname = obj_from_dict(d['nickname'], requester) if 'nickname' in d else None
+            item = cls(object=course, gui=gui, nickname=nickname, datestr=d['date'])
+            self.restore_children(item, d, requester)
+            gui.modelroot.appendRow([item, item.date])
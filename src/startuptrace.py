@@ -0,0 +1,96 @@
+# startuptrace.py
+import os
+import sys
+import builtins
+import threading
+from time import perf_counter
+from urllib import parse
+
+# run with --trace (or CANVAS_TRACE=1) to print a startup report to stdout
+ENABLED = '--trace' in sys.argv or bool(os.environ.get('CANVAS_TRACE'))
+
+REPORT_IMPORTS = 15 # slowest imports listed
+
+class StartupTrace(object):
+    """
+    records where startup time goes: named milestones, the import time
+    of every module first loaded after start(), and the latency of each
+    http request (see HttpClient.add_response_hook)
+    """
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.t0 = perf_counter()
+        self.marks = [] # (name, seconds since start)
+        self.imports = {} # module -> (cumulative, self) seconds
+        self.requests = [] # (seconds since start, method, url, status, seconds)
+        self.local = threading.local() # per thread: child import time of the imports in progress
+        self.original_import = None
+        self.reported = False
+
+    def start(self):
+        if self.enabled and self.original_import is None:
+            self.original_import = builtins.__import__
+            builtins.__import__ = self.traced_import
+
+    def traced_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level > 0 or name in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(0.0)
+        start = perf_counter()
+        try:
+            return self.original_import(name, globals, locals, fromlist, level)
+        finally:
+            total = perf_counter() - start
+            children = stack.pop()
+            if stack:
+                stack[-1] += total
+            self.imports[name] = (total, total - children)
+
+    def mark(self, name):
+        if self.enabled:
+            self.marks.append((name, perf_counter() - self.t0))
+
+    def observe(self, response, *args, **kwargs):
+        # requests response hook
+        if self.enabled:
+            url = parse.urlsplit(response.url)
+            self.requests.append((
+                perf_counter() - self.t0 - response.elapsed.total_seconds(),
+                response.request.method,
+                url.netloc + url.path,
+                response.status_code,
+                response.elapsed.total_seconds()
+            ))
+        return response
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+
+        lines = ['', 'Startup trace', '-' * 50]
+        for (name, t) in self.marks:
+            lines.append('{0:8.0f} ms  {1}'.format(1000 * t, name))
+
+        lines.append('')
+        lines.append('Slowest imports (cumulative / self):')
+        slowest = sorted(self.imports.items(), key=lambda kv: -kv[1][0])[:REPORT_IMPORTS]
+        for (name, (total, own)) in slowest:
+            lines.append('{0:8.0f} ms {1:6.0f} ms  {2}'.format(1000 * total, 1000 * own, name))
+
+        lines.append('')
+        lines.append('Requests ({0}, {1:.0f} ms in total):'.format(
+            len(self.requests), 1000 * sum(r[4] for r in self.requests)
+        ))
+        for (t, method, url, status, elapsed) in self.requests:
+            lines.append('{0:8.0f} ms {1:6.0f} ms  {2} {3} {4}'.format(1000 * t, 1000 * elapsed, status, method, url))
+
+        print('\n'.join(lines))
+
+TRACE = StartupTrace()
@@ -0,0 +1,146 @@
+# sync.py
+import json
+import threading
+from time import time
+
+from locations import CACHE, CacheFile
+from rowbridge import BRIDGE
+
+# attributes that change whenever canvas content changes, in order of preference
+STAMP_ATTRS = ['updated_at', 'modified_at', 'last_reply_at', 'posted_at']
+
+# incremental syncs skip removals; force a full one at least this often (seconds)
+FULL_SYNC_INTERVAL = 3600
+
+def stamp(obj):
+    for attr in STAMP_ATTRS:
+        val = getattr(obj, attr, None)
+        if val is not None:
+            return val
+    return None
+
+def signature(obj):
+    # public, plain attributes (used when an object has no stamp);
+    # objects without a __dict__ (__slots__ records) provide their own
+    if hasattr(obj, 'signature'):
+        return obj.signature()
+    return {k: v for (k, v) in vars(obj).items() if not k.startswith('_') and not k.endswith('_date')}
+
+def item_key(item):
+    return '{0}:{1}'.format(type(item).__name__, item.identifier())
+
+class SyncEngine(object):
+    """
+    brings an expanded item's children up to date without rebuilding them
+
+    fresh children are collected off-model, then diffed against the
+    current ones: new ones are inserted, changed ones update in place
+    (keeping their own children and expansion state), and missing ones
+    are removed
+
+    listings ordered by recency (see CanvasItem.since_last_sync) can stop
+    at the first unchanged entry: each keeps a persisted watermark of its
+    own (the newest value of the key it is ordered by), since a parent may
+    also list children in no particular order; incremental passes cannot
+    see deletions, so a full pass is done every FULL_SYNC_INTERVAL
+    """
+    def __init__(self, path=None):
+        self.path = path # default in CACHE, which is only created on save
+        self.lock = threading.RLock()
+        self.watermarks = {} # parent key -> {listing: newest ordering key seen}
+        self.last_full = {} # parent key -> time of last full sync
+        self.load()
+
+    def load(self):
+        path = self.path if self.path is not None else CACHE / 'syncstate.json'
+        try:
+            with open(str(path), 'r') as fobj:
+                js = json.load(fobj)
+            self.watermarks = js.get('watermarks', {})
+            self.last_full = js.get('last_full', {})
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        with self.lock:
+            js = {'watermarks': self.watermarks, 'last_full': self.last_full}
+            path = self.path if self.path is not None else CacheFile('syncstate.json')
+            with open(str(path), 'w') as fobj:
+                json.dump(js, fobj)
+
+    def watermark(self, parent, listing):
+        marks = self.watermarks.get(item_key(parent))
+        return marks.get(listing) if isinstance(marks, dict) else None
+
+    def is_incremental(self, parent):
+        last = self.last_full.get(item_key(parent))
+        return parent.ORDERED_LISTING and last is not None and time() - last < FULL_SYNC_INTERVAL
+
+    def record(self, parent, listing_marks):
+        # listing_marks: {listing: newest ordering key seen} (see CanvasItem.since_last_sync)
+        with self.lock:
+            key = item_key(parent)
+            marks = self.watermarks.get(key)
+            if not isinstance(marks, dict):
+                marks = self.watermarks[key] = {}
+            for (listing, mark) in listing_marks.items():
+                marks[listing] = max(mark, marks.get(listing, ''))
+
+    def changed(self, old, new):
+        (s_old, s_new) = (stamp(old.obj), stamp(new.obj))
+        if s_old is not None or s_new is not None:
+            return s_old != s_new
+        return signature(old.obj) != signature(new.obj)
+
+    def sync(self, parent, **kwargs):
+        incremental = self.is_incremental(parent)
+        enabled = parent.isEnabled()
+
+        parent.sync_mode = 'incremental' if incremental else 'full'
+        parent.listing_marks = {}
+        try:
+            fresh = parent.collect_children(**kwargs)
+        finally:
+            parent.sync_mode = None
+
+        # may run on a worker thread: the model itself is changed through BRIDGE
+        if incremental: # nothing new is not the same as empty
+            BRIDGE.call(parent.setEnabled, enabled)
+        elif fresh:
+            BRIDGE.call(parent.setEnabled, True)
+
+        inserted = self.apply(parent, fresh, remove=not incremental)
+
+        self.record(parent, parent.listing_marks)
+        if not incremental:
+            self.last_full[item_key(parent)] = time()
+        self.save()
+
+        return inserted
+
+    def apply(self, parent, fresh, remove=True):
+        # minimal insert / update / remove of parent's rows to match fresh
+        existing = {item_key(ch): ch for ch in parent.children()}
+        fresh_keys = set()
+        inserted = []
+
+        for item in fresh:
+            key = item_key(item)
+            fresh_keys.add(key)
+            old = existing.get(key)
+            if old is None:
+                parent.append_item_row(item)
+                inserted.append(item)
+            elif self.changed(old, item):
+                BRIDGE.call(old.update_from, item)
+                if old.rowCount() > 0: # changed containers resync their own children
+                    self.sync(old)
+
+        if remove:
+            for r in reversed(range(parent.rowCount())):
+                if item_key(parent.child(r, 0)) not in fresh_keys:
+                    parent.remove_item_row(r)
+
+        return inserted
+
+SYNC = SyncEngine()
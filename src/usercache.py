@@ -0,0 +1,93 @@
+# usercache.py
+import os
+import json
+import hashlib
+import threading
+from time import time
+
+from canvasapi.user import User
+from canvasapi.current_user import CurrentUser
+
+from locations import CacheFile
+
+TTL = 12 * 60 * 60 # seconds a profile saved by an earlier session is trusted
+
+class CachedUser(CurrentUser):
+    # a CurrentUser built from known attributes, without requesting users/self
+    def __init__(self, requester, attributes):
+        User.__init__(self, requester, attributes)
+
+def write_private(path, data):
+    # profiles and avatars are personal data: readable by the user only
+    fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as fobj:
+        fobj.write(data)
+    os.chmod(str(path), 0o600) # in case the file already existed
+
+def requester_key(requester):
+    # tokens are never written to disk, only this digest
+    text = '{0}\n{1}'.format(requester.base_url, requester.access_token)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class UserCache(object):
+    """
+    the current user's profile, per baseurl and token
+
+    fetched at most once a session (not at all while the copy saved by an
+    earlier session is younger than TTL, except to validate the token:
+    see fresh); the profile carries everything
+    read from the current user, so the user object itself is built from
+    it; avatar images are kept on disk, by url
+    """
+    def __init__(self, path=None):
+        self.path = path if path is not None else CacheFile('users.json')
+        self.lock = threading.Lock()
+        self.profiles = {} # key -> {'profile': dict, 'fetched': time}
+        self.session = set() # keys fetched by this session
+        try:
+            with open(str(self.path), 'r') as fobj:
+                self.profiles = json.load(fobj)
+        except (OSError, ValueError):
+            pass
+
+    def profile(self, canvas, fresh=False):
+        # fresh: ask canvas even if cached (so a revoked token is noticed)
+        requester = canvas._Canvas__requester
+        key = requester_key(requester)
+        with self.lock:
+            entry = self.profiles.get(key)
+            if fresh or entry is None or (key not in self.session and time() - entry['fetched'] >= TTL):
+                # raises as get_current_user would (ConnectionError, InvalidAccessToken)
+                data = requester.request('GET', 'users/self/profile').json()
+                entry = {'profile': data, 'fetched': time()}
+                self.profiles[key] = entry
+                self.session.add(key)
+                self.save_locked()
+            return dict(entry['profile'])
+
+    def user(self, canvas):
+        return CachedUser(canvas._Canvas__requester, self.profile(canvas))
+
+    def forget(self, canvas):
+        key = requester_key(canvas._Canvas__requester)
+        with self.lock:
+            self.session.discard(key)
+            if self.profiles.pop(key, None) is not None:
+                self.save_locked()
+
+    def save_locked(self):
+        tmp = self.path.with_suffix('.tmp')
+        write_private(tmp, json.dumps(self.profiles).encode('utf-8'))
+        tmp.replace(self.path)
+
+    def avatar(self, url, get):
+        # image bytes at url (fetched with get, a url -> response function, once)
+        path = CacheFile('avatar-{}'.format(hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]))
+        if path.is_file():
+            return path.read_bytes()
+        r = get(url)
+        if r.ok:
+            write_private(path, r.content)
+        return r.content
+
+USERS = UserCache()
@@ -3,6 +3,7 @@ from pathlib import Path
 import json
 import os, sys
 import warnings
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from requests.exceptions import ConnectionError
 
 from PyQt5.QtCore import QDateTime, QSize, QTimer
@@ -10,24 +11,49 @@ from PyQt5.QtWidgets import (QApplication, QComboBox, QDialog,
 QPlainTextEdit, QDialogButtonBox, QFormLayout, QGridLayout, QHBoxLayout,
 QLabel, QLineEdit, QToolButton, QPushButton, QSpinBox, QTextEdit,
 QVBoxLayout, QStyle, QCheckBox, QFileDialog)
-from PyQt5.Qt import Qt
+from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
 
 from canvasapi import Canvas
 from canvasapi.exceptions import InvalidAccessToken
 from classdefs import CourseItem, CONTENT_TYPES
+from gqlbackend import BACKENDS
+from echorecord import DOWNLOAD_PROFILES, RESOLUTIONS
+from asyncengine import ENGINES, ENGINE
 
 from locations import ResourceFile, HOME
-
-import keyring
-
-# this is necessary to address issue where bundled app does not find keyring backend
-if sys.platform == 'darwin': # macOS solution
-    import keyring.backends.OS_X
-    keyring.set_keyring(keyring.backends.OS_X.Keyring())
-else: # Windows solution
-    import keyring.backends.Windows
-    keyring.set_keyring(keyring.backends.Windows.WinVaultKeyring())
+from network import CLIENT
+from snapshot import snapshot_path
+from usercache import USERS
+from rowbridge import BRIDGE
+
+def load_keyring():
+    # imported on first use: keyring and its backends are slow to import
+    import keyring
+
+    # this is necessary to address issue where bundled app does not find keyring backend
+    if sys.platform == 'darwin': # macOS solution
+        import keyring.backends.OS_X
+        keyring.set_keyring(keyring.backends.OS_X.Keyring())
+    else: # Windows solution
+        import keyring.backends.Windows
+        keyring.set_keyring(keyring.backends.Windows.WinVaultKeyring())
+    return keyring
+
+VALIDATE_TIMEOUT = 10 # seconds before an unanswered account check counts as offline
+
+# account checks (network) run here, never on the gui thread
+VALIDATOR = ThreadPoolExecutor(max_workers=2)
+
+def account_status(canvas):
+    # 'ok', 'badtoken' or 'offline'
+    try:
+        USERS.profile(canvas, fresh=True) # always asked; later profile reads use the cache
+    except ConnectionError:
+        return 'offline'
+    except InvalidAccessToken:
+        return 'badtoken'
+    return 'ok'
 
 class InvalidPreferences(Exception):
     pass
@@ -39,6 +65,10 @@ class Preferences(QDialog):
     token
     download location
     default content type
+    api backend
+    network engine
+    echo360 download profile and auto resolution
+    echo360 archive bandwidth cap
     """
 
     AUTOLOAD_FILE = HOME / '.canvasdefaults'
@@ -52,12 +82,15 @@ class Preferences(QDialog):
 
         self.current = {}
         self.messages = []
+        self.validating = None # candidates whose account check is in flight
 
         self.build()
 
         candidates = self.load_from_file(self.AUTOLOAD_FILE)
 
-        (isvalid, candidates) = self.validate(candidates)
+        # saved settings are only checked locally here: the account is checked
+        # once the window is up (see CanvasApp.startup_network)
+        (isvalid, candidates) = self.check_fields(candidates, 'unchecked')
         if all(isvalid.values()):
             self.current = candidates
             self.send_message('Preferences loaded from {} file.'.format(self.AUTOLOAD_FILE.name))
@@ -68,8 +101,6 @@ class Preferences(QDialog):
 
         self.contentComboBox.currentIndexChanged.connect(self.check_content_changed)
 
-        self.get_web_credentials(self.current)
-
     def build(self):
         self.setWindowTitle('Canvas Preferences')
 
@@ -102,6 +133,32 @@ class Preferences(QDialog):
             self.contentComboBox.addItem(ct['displayname'])
         self.mainLayout.addRow('Default Content:', self.contentComboBox)
 
+        self.backendComboBox = QComboBox()
+        for b in BACKENDS:
+            self.backendComboBox.addItem(b['displayname'], b['tag'])
+        self.mainLayout.addRow('Course Loading:', self.backendComboBox)
+
+        self.engineComboBox = QComboBox()
+        for e in ENGINES:
+            self.engineComboBox.addItem(e['displayname'], e['tag'])
+        self.mainLayout.addRow('Network Engine:', self.engineComboBox)
+
+        self.echoProfileComboBox = QComboBox()
+        for p in DOWNLOAD_PROFILES:
+            self.echoProfileComboBox.addItem(p['displayname'], p['tag'])
+        self.mainLayout.addRow('Lecture Downloads:', self.echoProfileComboBox)
+
+        self.echoResolutionComboBox = QComboBox()
+        for r in RESOLUTIONS:
+            self.echoResolutionComboBox.addItem('{}p'.format(r), r)
+        self.mainLayout.addRow('Auto Resolution:', self.echoResolutionComboBox)
+
+        self.echoBandwidthSpinBox = QSpinBox()
+        self.echoBandwidthSpinBox.setRange(0, 1000)
+        self.echoBandwidthSpinBox.setSuffix(' MB/s')
+        self.echoBandwidthSpinBox.setSpecialValueText('Unlimited') # shown for 0
+        self.mainLayout.addRow('Archive Bandwidth:', self.echoBandwidthSpinBox)
+
         self.saveLayout = QHBoxLayout()
         self.saveLabel = QLabel('Save validated preferences as defaults:')
         self.saveLabel.setAlignment(Qt.AlignRight)
@@ -156,13 +213,16 @@ class Preferences(QDialog):
         self.tokenField.setText(prefs.get('token', ''))
         self.pathField.setText(prefs.get('downloadfolder', ''))
         self.contentComboBox.setCurrentIndex(prefs.get('defaultcontent', 0))
+        self.backendComboBox.setCurrentIndex(max(self.backendComboBox.findData(prefs.get('backend', 'rest')), 0))
+        self.engineComboBox.setCurrentIndex(max(self.engineComboBox.findData(prefs.get('engine', 'threads')), 0))
+        self.echoProfileComboBox.setCurrentIndex(max(self.echoProfileComboBox.findData(prefs.get('echoprofile', 'hd')), 0))
+        self.echoResolutionComboBox.setCurrentIndex(max(self.echoResolutionComboBox.findData(prefs.get('echoresolution', 720)), 0))
+        self.echoBandwidthSpinBox.setValue(prefs.get('echobandwidth', 0))
 
     def populate_with_current(self):
-        # double check that current settings are valid
-        (isvalid, validated) = self.validate(self.current)
-        assert all(isvalid.values()) 
-
-        self.populate_fields(validated)
+        # current settings were validated when saved: no network check here
+        # (changes are validated in the background on save, see accept_if_valid)
+        self.populate_fields(self.current)
 
     def check_content_changed(self, newindex):
         self.saveValidated.setChecked(newindex != self.current['defaultcontent'])
@@ -172,7 +232,12 @@ class Preferences(QDialog):
             'baseurl': self.baseurlField.text(),
             'token': self.tokenField.text(),
             'downloadfolder': self.pathField.text(),
-            'defaultcontent': self.contentComboBox.currentIndex()
+            'defaultcontent': self.contentComboBox.currentIndex(),
+            'backend': self.backendComboBox.currentData(),
+            'engine': self.engineComboBox.currentData(),
+            'echoprofile': self.echoProfileComboBox.currentData(),
+            'echoresolution': self.echoResolutionComboBox.currentData(),
+            'echobandwidth': self.echoBandwidthSpinBox.value()
         }
         return prefs
 
@@ -187,15 +252,25 @@ class Preferences(QDialog):
             candidates['token'] = j.get('token', '')
             candidates['downloadfolder'] = j.get('downloadfolder', '')
             candidates['defaultcontent'] = j.get('defaultcontent', 'modules')
+            candidates['backend'] = j.get('backend', 'rest')
+            candidates['engine'] = j.get('engine', 'threads')
+            candidates['echoprofile'] = j.get('echoprofile', 'hd')
+            candidates['echoresolution'] = j.get('echoresolution', 720)
+            candidates['echobandwidth'] = j.get('echobandwidth', 0)
 
         return candidates
 
     def get_web_credentials(self, prefs):
-        canvas = Canvas(
+        canvas = CLIENT.attach(Canvas(
             prefs['baseurl'],
             prefs['token']
-        )
-        profile = canvas.get_current_user().get_profile()
+        ))
+        try:
+            profile = USERS.profile(canvas)
+        except ConnectionError:
+            self.web_credentials = {'canvas': None, 'echo360': None}
+            return
+        keyring = load_keyring()
         self.web_credentials = {
             'canvas': keyring.get_credential(self.CANVAS_KEY, profile['login_id']),
             'echo360': keyring.get_credential(self.ECHO360_KEY, profile['primary_email'])
@@ -225,11 +300,32 @@ class Preferences(QDialog):
         self.cancelButton.setEnabled(cancellable)
         accepted = bool(self.exec_())
         self.cancelButton.setEnabled(True)
+        self.end_validation()
         return accepted
 
     def accept_if_valid(self):
+        # the account check runs in the background; the dialog stays responsive
         candidates = self.gather_fields()
-        (isvalid, candidates) = self.validate(candidates)
+        self.validating = candidates
+        self.okButton.setEnabled(False)
+        self.okButton.setText('Validating...')
+
+        account = self.check_account(candidates)
+        account.add_done_callback(lambda f: BRIDGE.post(self.finish_validation, candidates, f))
+        QTimer.singleShot(1000 * VALIDATE_TIMEOUT, lambda: self.finish_validation(candidates, None))
+
+    def end_validation(self):
+        self.validating = None
+        self.okButton.setEnabled(True)
+        self.okButton.setText('Validate and Apply')
+
+    def finish_validation(self, candidates, account):
+        # account is the finished check, or None once VALIDATE_TIMEOUT has passed
+        if self.validating is not candidates:
+            return # answered already, or superseded
+        self.end_validation()
+
+        (isvalid, candidates) = self.check_fields(candidates, self.account_result(account))
         if all(isvalid.values()):
             self.current = candidates
             if self.saveValidated.isChecked():
@@ -248,34 +344,66 @@ class Preferences(QDialog):
             self.color_red_temporarily(self.pathField)
         if 'defaultcontent' in invalid:
             self.color_red_temporarily(self.contentComboBox)
+        if 'backend' in invalid:
+            self.color_red_temporarily(self.backendComboBox)
+        if 'engine' in invalid:
+            self.color_red_temporarily(self.engineComboBox)
+        if 'echoprofile' in invalid:
+            self.color_red_temporarily(self.echoProfileComboBox)
+        if 'echoresolution' in invalid:
+            self.color_red_temporarily(self.echoResolutionComboBox)
+        if 'echobandwidth' in invalid:
+            self.color_red_temporarily(self.echoBandwidthSpinBox)
 
     def color_red_temporarily(self, widget):
         widget.setStyleSheet("background-color: rgba(255,0,0,100)")
         QTimer.singleShot(400, lambda: widget.setStyleSheet(""))
 
-    def validate(self, candidates):
+    def check_account(self, candidates):
+        # Future of the account status: 'ok', 'badurl', 'badtoken' or 'offline'
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            c = CLIENT.attach(Canvas(candidates.get('baseurl', ''), candidates.get('token', '')))
+
+        if len(w) > 0:
+            future = Future()
+            future.set_result('badurl')
+            return future
+        return VALIDATOR.submit(account_status, c)
+
+    @staticmethod
+    def account_result(account):
+        if account is None:
+            return 'offline'
+        try:
+            return account.result(timeout=0)
+        except FutureTimeout:
+            return 'offline'
+        except Exception:
+            return 'badurl'
+
+    def check_fields(self, candidates, account):
 
         valid = {k:True for k in candidates.keys()} # start with all true
 
         trialbaseurl = candidates.get('baseurl', '')
-        trialtoken = candidates.get('token', '')
         trialfolder = candidates.get('downloadfolder', '')
         trialcontent = candidates.get('defaultcontent', '')
+        trialbackend = candidates.get('backend', 'rest')
+        trialengine = candidates.get('engine', 'threads')
+        trialprofile = candidates.get('echoprofile', 'hd')
+        trialresolution = candidates.get('echoresolution', 720)
+        trialbandwidth = candidates.get('echobandwidth', 0)
 
-        with warnings.catch_warnings(record=True) as w:
-            warnings.simplefilter('always')
-            c = Canvas(trialbaseurl, trialtoken)
-        
-        if len(w) > 0:
+        if account == 'badurl':
             valid['baseurl'] = False
-        else:
-            try:
-                c.get_current_user()
-            except ConnectionError:
+        elif account == 'offline':
+            # offline (or no answer in time) is acceptable if there is a snapshot to show
+            if not snapshot_path(trialbaseurl, candidates.get('token', '')).is_file():
                 valid['baseurl'] = False
-            except InvalidAccessToken:
-                # valid['baseurl'] = False
-                valid['token'] = False
+        elif account == 'badtoken':
+            # valid['baseurl'] = False
+            valid['token'] = False
 
         p = Path(trialfolder)
 
@@ -316,6 +444,34 @@ class Preferences(QDialog):
 
         candidates['defaultcontent'] = ct
 
+        if trialbackend not in [b['tag'] for b in BACKENDS]:
+            valid['backend'] = False
+
+        candidates['backend'] = trialbackend
+
+        # the asyncio engine needs httpx
+        if trialengine not in [e['tag'] for e in ENGINES] or (trialengine == 'asyncio' and not ENGINE.available()):
+            valid['engine'] = False
+
+        candidates['engine'] = trialengine
+
+        if trialprofile not in [p['tag'] for p in DOWNLOAD_PROFILES]:
+            valid['echoprofile'] = False
+
+        candidates['echoprofile'] = trialprofile
+
+        try:
+            trialresolution = int(trialresolution)
+        except (TypeError, ValueError):
+            valid['echoresolution'] = False
+
+        candidates['echoresolution'] = trialresolution
+
+        if not isinstance(trialbandwidth, int) or trialbandwidth < 0:
+            valid['echobandwidth'] = False
+
+        candidates['echobandwidth'] = trialbandwidth
+
         return (valid, candidates)
 
 if __name__ == '__main__':
@@ -0,0 +1,153 @@
+# websession.py
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from urllib import parse
+
+from requests.cookies import create_cookie
+
+from locations import CacheFile
+from network import CLIENT
+
+LOGIN_TIMEOUT = 30 # seconds a caller waits for a login still in progress
+
+ECHO_TESTURL = 'https://echo360.org/user/enrollments' # returns json only if authenticated
+
+COOKIE_FIELDS = ['name', 'value', 'domain', 'path', 'secure', 'expires']
+
+def save_cookies(jar, path):
+    cookies = [{f: getattr(c, f) for f in COOKIE_FIELDS} for c in jar]
+    # session cookies are as good as a password: readable by the user only
+    fd = os.open(str(path), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as fobj:
+        json.dump(cookies, fobj)
+    os.chmod(str(path), 0o600) # in case the file already existed
+
+def load_cookies(jar, path):
+    try:
+        with open(str(path), 'r') as fobj:
+            cookies = json.load(fobj)
+    except (OSError, ValueError):
+        return False
+    for c in cookies:
+        jar.set_cookie(create_cookie(**c))
+    return len(cookies) > 0
+
+# login (and bs4, keyring with it) is imported on the login threads, not at startup
+def canvas_login(credential, baseurl, sess):
+    from login import auth_canvas_session
+    return auth_canvas_session(credential, baseurl, sess)
+
+def echo_login(credential, sess):
+    from login import auth_echo_session
+    return auth_echo_session(credential, sess)
+
+class WebLogin(object):
+    """
+    one web (non-api) login, done in a session of its own
+
+    cookies from the last successful login are tried first, with a single
+    request to check they are still accepted; the full login flow only
+    runs when they are not
+    """
+    def __init__(self, name, credential, login, check, site=''):
+        self.name = name
+        self.credential = credential
+        self.login = login # sess -> sess or None
+        self.check = check # sess -> bool
+        self.path = CacheFile('cookies-{0}-{1}.json'.format(name, self.account_digest(site)))
+        self.future = Future()
+
+    def account_digest(self, site):
+        # one cookie file per site and account
+        username = getattr(self.credential, 'username', '')
+        return hashlib.sha256('{0}\n{1}'.format(site, username).encode('utf-8')).hexdigest()[:16]
+
+    def run(self):
+        if self.credential is None:
+            return False
+
+        sess = CLIENT.new_session()
+        if load_cookies(sess.cookies, self.path) and self.check(sess):
+            return sess
+
+        sess = CLIENT.new_session()
+        if self.login(sess) is None or not self.check(sess):
+            return False
+        save_cookies(sess.cookies, self.path)
+        return sess
+
+class WebLogins(object):
+    """
+    canvas (for lti launches) and echo360 logins, run concurrently at startup
+
+    each login has its own cookie jar; once it succeeds its cookies are
+    merged into the shared api session (which the tool items use); callers
+    wait on authenticated() rather than polling a flag
+    """
+    def __init__(self, credentials, baseurl, session):
+        self.session = session
+        self.lock = threading.Lock()
+        self.logins = {
+            'canvas': WebLogin('canvas', credentials['canvas'],
+                lambda sess: canvas_login(credentials['canvas'], baseurl, sess),
+                lambda sess: self.check_canvas(sess, baseurl),
+                site=baseurl
+            ),
+            'echo360': WebLogin('echo360', credentials['echo360'],
+                lambda sess: echo_login(credentials['echo360'], sess),
+                self.check_echo,
+                site=ECHO_TESTURL
+            )
+        }
+
+    @staticmethod
+    def check_canvas(sess, baseurl):
+        # the site root redirects to the login page unless authenticated
+        # (the redirect is not followed, so this is one small response)
+        testurl = parse.urlunsplit(parse.urlsplit(baseurl)._replace(path=''))
+        try:
+            r = sess.get(testurl, allow_redirects=False)
+        except Exception:
+            return False
+        if r.is_redirect:
+            return 'login' not in parse.urlsplit(r.headers.get('location', '')).path
+        return r.ok
+
+    @staticmethod
+    def check_echo(sess):
+        try:
+            sess.get(ECHO_TESTURL).json()
+            return True
+        except Exception:
+            return False
+
+    def start(self):
+        for login in self.logins.values():
+            threading.Thread(target=self.run, args=(login,), daemon=True).start()
+
+    def run(self, login):
+        try:
+            sess = login.run()
+        except Exception:
+            sess = False
+        if sess:
+            with self.lock:
+                self.session.cookies.update(sess.cookies)
+        login.future.set_result(bool(sess))
+
+    def done(self, name):
+        return self.logins[name].future.done()
+
+    def when_done(self, name, fcn):
+        # fcn() is called (on the login thread, or now if already done) once the login ends
+        self.logins[name].future.add_done_callback(lambda f: fcn())
+
+    def authenticated(self, name, timeout=LOGIN_TIMEOUT):
+        # blocks until the login is done (at most timeout seconds; 0 to not wait)
+        try:
+            return self.logins[name].future.result(timeout=timeout)
+        except FutureTimeout:
+            return False
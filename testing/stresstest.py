@@ -23,7 +23,7 @@ print('Load time: {:.2f} s'.format(loadtime))
 courseitems = len(CONTENT_TYPES) * len(list(gui.canvas.get_courses(include=['term', 'favorites'])))
 
 while gui.model.rowCount() < courseitems:
-    pass
+    app.processEvents() # rows arrive through the event loop (see rowbridge.py)
 
 print('All {} items loaded.'.format(gui.model.rowCount()))
 